@@ -0,0 +1,200 @@
+import argparse
+import contextlib
+import glob
+import json
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+import matplotlib
+matplotlib.use("Agg")  # Batch runs never open plot windows
+import numpy as np
+import pandas as pd
+from modules.merge_data import merge_county_data
+from modules.visualization import set_output_dir
+from main import run_pipeline, load_corner_statistics, load_survey_cycle
+
+# Merged frame rebuilt once per worker process around the shared numeric columns
+_worker_shm = None
+_worker_frame = None
+
+
+def collect_configs(paths):
+    """
+    Expands directories and file paths into a sorted list of (name, config) pairs.
+    The name is the config file's stem and becomes the run's result directory.
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, "*.json"))))
+        else:
+            files.append(path)
+
+    configs = []
+    for file in files:
+        with open(file, "r") as f:
+            configs.append((os.path.splitext(os.path.basename(file))[0], json.load(f)))
+
+    names = [name for name, _ in configs]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"Config names must be unique, found duplicates: {duplicates}")
+    return configs
+
+
+def share_frame(frame):
+    """
+    Copies the numeric columns of a frame into shared memory, each column contiguous and in its own dtype.
+
+    Returns:
+    - tuple: (SharedMemory, spec) where spec is the small, picklable description workers use to
+      rebuild the frame (shared-memory name, each numeric column's dtype and offset, and the non-numeric columns).
+    """
+    # Plain NumPy numeric columns only; extension dtypes (e.g. nullable integers) travel with the other columns
+    numeric = frame[[column for column, dtype in frame.dtypes.items()
+                     if isinstance(dtype, np.dtype) and dtype.kind in "iuf"]]
+    layout, offset = [], 0
+    for column, dtype in numeric.dtypes.items():
+        layout.append((column, str(dtype), offset))
+        # Keep every column 8-byte aligned
+        offset += -(-len(frame) * dtype.itemsize // 8) * 8
+    shm = shared_memory.SharedMemory(create=True, size=max(1, offset))
+    for column, dtype, start in layout:
+        np.ndarray(len(frame), dtype=dtype, buffer=shm.buf, offset=start)[:] = numeric[column].to_numpy()
+
+    spec = {
+        "name": shm.name,
+        "rows": len(frame),
+        "layout": layout,
+        "other": frame.drop(columns=numeric.columns),
+        "columns": frame.columns.tolist(),
+    }
+    return shm, spec
+
+
+def _attach_shared_frame(spec):
+    """Pool initializer: maps the shared numeric columns and rebuilds the merged frame around them without copying."""
+    global _worker_shm, _worker_frame
+    # Pool workers share the parent's resource tracker, so the parent's unlink remains the only cleanup
+    _worker_shm = shared_memory.SharedMemory(name=spec["name"])
+
+    columns = {column: spec["other"][column] for column in spec["other"].columns}
+    for column, dtype, offset in spec["layout"]:
+        columns[column] = np.ndarray(spec["rows"], dtype=dtype, buffer=_worker_shm.buf, offset=offset)
+    # The numeric columns stay views of the shared buffer; run_pipeline only works on copy-on-write copies
+    _worker_frame = pd.DataFrame({column: columns[column] for column in spec["columns"]},
+                                 index=spec["other"].index, copy=False)
+
+
+def _run_config(name, config, output_root):
+    """Runs one config against the shared frame, writing its outputs, figures and log to its own directory."""
+    output_dir = os.path.join(output_root, name)
+    os.makedirs(output_dir, exist_ok=True)
+    config = dict(config, output_dir=output_dir)
+    set_output_dir(output_dir)
+
+    status, error = "ok", None
+    start = time.perf_counter()
+    with open(os.path.join(output_dir, "run.log"), "w") as log, contextlib.redirect_stdout(log):
+        try:
+            run_pipeline(config, merged_data=_worker_frame)
+        except Exception as e:
+            status, error = "failed", repr(e)
+            traceback.print_exc(file=log)
+
+    return {
+        "config": name,
+        "analysis_type": config.get("analysis_type", "knn"),
+        "status": status,
+        "seconds": time.perf_counter() - start,
+        "output_dir": output_dir,
+        "error": error,
+    }
+
+
+def run_batch(config_paths, output_root="results/batch", max_workers=None):
+    """
+    Runs many config variants against data that is loaded and merged once.
+
+    Configs are grouped by their merge inputs (`file_paths`, `history.cycle` and the corner settings); each group's merged frame is placed in shared memory
+    and its configs are fanned out over a process pool. Each config's outputs land in
+    <output_root>/<config name>/ and a combined timing summary is written to <output_root>/timing_summary.csv.
+
+    Parameters:
+    - config_paths (list): Config files and/or directories of *.json configs.
+    - output_root (str): Directory receiving one result directory per config.
+    - max_workers (int): Number of worker processes (defaults to the number of cores).
+
+    Returns:
+    - pd.DataFrame: Timing summary with one row per config plus one row per data load.
+    """
+    configs = collect_configs(config_paths)
+    os.makedirs(output_root, exist_ok=True)
+    print(f"Running {len(configs)} configs with up to {max_workers or os.cpu_count()} workers...")
+
+    # Configs merging the same inputs (raw files, survey cycle and corner records) share one merged frame
+    groups = {}
+    for name, config in configs:
+        merge_inputs = {
+            "file_paths": config["file_paths"],
+            "cycle": config.get("history", {}).get("cycle"),
+            "corners": config.get("corners", {}) if config["file_paths"].get("corners") else None,
+        }
+        groups.setdefault(json.dumps(merge_inputs, sort_keys=True), []).append((name, config))
+
+    summary = []
+    for group in groups.values():
+        file_paths = group[0][1]["file_paths"]
+        start = time.perf_counter()
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            merged = merge_county_data(
+                file_paths["state_survey"],
+                file_paths["population"],
+                file_paths["road"],
+                file_paths["wetlands"],
+                state_survey=load_survey_cycle(group[0][1]),
+                corner_stats=load_corner_statistics(group[0][1]),
+                max_workers=group[0][1].get("ingest_workers", 4)
+            )
+        summary.append({"config": "<load and merge>", "analysis_type": None, "status": "ok",
+                        "seconds": time.perf_counter() - start, "output_dir": None, "error": None})
+
+        shm, spec = share_frame(merged)
+        try:
+            with ProcessPoolExecutor(max_workers=max_workers, initializer=_attach_shared_frame, initargs=(spec,)) as executor:
+                futures = []
+                for name, config in group:
+                    if (config.get("analysis_type") == "clustering" and config["clustering"].get("n_clusters") is None
+                            and config["clustering"].get("mode", "fit") == "fit"):
+                        summary.append({"config": name, "analysis_type": "clustering", "status": "skipped",
+                                        "seconds": 0.0, "output_dir": None,
+                                        "error": "clustering.n_clusters must be set for batch runs (no elbow prompt)."})
+                        continue
+                    futures.append(executor.submit(_run_config, name, config, output_root))
+
+                for future in as_completed(futures):
+                    result = future.result()
+                    summary.append(result)
+                    print(f"[{result['status']}] {result['config']} ({result['analysis_type']}) in {result['seconds']:.2f}s")
+        finally:
+            shm.close()
+            shm.unlink()
+
+    summary = pd.DataFrame(summary)
+    summary_path = os.path.join(output_root, "timing_summary.csv")
+    summary.to_csv(summary_path, index=False)
+    print(summary[["config", "analysis_type", "status", "seconds"]].to_string(index=False))
+    print(f"Timing summary saved to {summary_path}")
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run many config.json variants in parallel on data merged once.")
+    parser.add_argument("configs", nargs="+", help="Config files and/or directories containing *.json configs.")
+    parser.add_argument("--output-dir", default="results/batch", help="Directory receiving one result directory per config.")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes (default: all cores).")
+    args = parser.parse_args()
+
+    run_batch(args.configs, output_root=args.output_dir, max_workers=args.workers)
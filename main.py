@@ -1,15 +1,46 @@
 import json
+import os
+import numpy as np
 import pandas as pd
+import scipy.sparse as sp
 from modules.load_data import load_csv
 from modules.merge_data import merge_county_data
 from modules.preprocess import (
     standardize,
+    scaling_parameters,
+    project,
+    load_projection,
+    compact_frame,
+    memory_report,
     filter_data
 )
-from modules.clustering import find_optimal_clusters, perform_clustering
-from modules.evaluation import evaluate_clusters
-from modules.analysis import find_target_neighbors, find_nearest_neighbors
+from modules.clustering import (
+    find_optimal_clusters,
+    perform_clustering,
+    perform_incremental_clustering,
+    build_cluster_model,
+    align_cluster_ids,
+    assign_clusters,
+    save_cluster_model,
+    load_cluster_model
+)
+from modules.evaluation import evaluate_clusters, cluster_stability
+from modules.analysis import find_target_neighbors, find_all_neighbors, find_nearest_neighbors, predict_costs_loo
+from modules.neighbors import neighbor_recall_report
+from modules.spatial import build_county_graph
+from modules.graph import neighbor_graph, neighbor_graph_report
+from modules.history import ingest_cycle, load_cycle, cycle_deltas
+from modules.aggregate import aggregate_corners
+from modules.incremental import (
+    build_neighbor_state,
+    update_neighbor_state,
+    neighbor_table,
+    save_neighbor_state,
+    load_neighbor_state
+)
+from modules.statistics import bootstrap_neighbor_statistics, neighbor_permutation_test
 from modules.visualization import (
+    set_figure_cache,
     visualize_clusters_interactive,
     visualize_cost_distribution,
     visualize_target_neighbor_distribution,
@@ -18,27 +49,56 @@ from modules.visualization import (
     visualize_3d_with_costs
 )
 
-# Load configuration file
-with open("config.json", "r") as f:
-    config = json.load(f)
+def output_path(config, default_path):
+    """
+    Returns where an output file is written: inside config["output_dir"] when it is set
+    (as batch runs do), otherwise at its default path.
+    """
+    output_dir = config.get("output_dir")
+    if not output_dir:
+        return default_path
+    os.makedirs(output_dir, exist_ok=True)
+    return os.path.join(output_dir, os.path.basename(default_path))
 
-def run_knn_analysis(data, data_std, config):
+def load_spatial_graph(config):
+    """
+    Returns the cached county adjacency graph when spatial neighbors are enabled in the config, else None.
+    """
+    spatial_config = config.get("spatial", {})
+    if not spatial_config.get("enabled", False):
+        return None
+    return build_county_graph(
+        shapefile_path=spatial_config.get("shapefile", "data/raw/County.shp"),
+        name_column=spatial_config.get("name_column", "Name"),
+        cache_path=spatial_config.get("cache", "data/processed/county_graph.npz"),
+        max_distance_km=spatial_config.get("graph_max_distance_km", 250)
+    )
+
+def run_knn_analysis(data, data_std, config, plot_data=None):
+    """
+    Finds and plots the neighbors of the target county (or counties). The 3D figures are drawn from
+    `plot_data` when it is given (the standardized metrics when data_std holds projected components).
+    """
     target_county = config["knn"]["target_county"]
+    # A list of target counties is answered with one fitted index and one batched query
+    targets = [target_county] if isinstance(target_county, str) else list(target_county)
+    run_recall_report(data_std, config)
 
     # Check for NaN values in County column
     if data_std["County"].isnull().any():
         print("Warning: NaN values detected in 'County' column of data_std.")
     
-    # Ensure target county exists in both data and data_std
-    if target_county in data["County"].values:
-        print(f"'{target_county}' found in raw data (data).")
-    else:
-        print(f"Error: '{target_county}' not found in raw data (data).")
-    
-    if target_county in data_std["County"].values:
-        print(f"'{target_county}' found in standardized data (data_std).")
-    else:
-        print(f"Error: '{target_county}' not found in standardized data (data_std).")
+    # Ensure target counties exist in both data and data_std
+    for target in targets:
+        if target in data["County"].values:
+            print(f"'{target}' found in raw data (data).")
+        else:
+            print(f"Error: '{target}' not found in raw data (data).")
+
+        if target in data_std["County"].values:
+            print(f"'{target}' found in standardized data (data_std).")
+        else:
+            print(f"Error: '{target}' not found in standardized data (data_std).")
 
     # Check if data_std contains NaN values in the metrics columns
     metrics = config["knn"].get("metrics", ["wetlandd", "pop_d", "roadoverarea"])
@@ -53,47 +113,127 @@ def run_knn_analysis(data, data_std, config):
         target_county=target_county,
         n_neighbors=config["knn"]["n_neighbors"],
         metrics=metrics,
-        verbose=config["knn"].get("verbose", False)
+        verbose=config["knn"].get("verbose", False),
+        backend=config["knn"].get("backend", "exact"),
+        backend_params=config["knn"].get("backend_params"),
+        spatial=load_spatial_graph(config),
+        spatial_options=config.get("spatial"),
+        query_mode=config["knn"].get("query_mode", "k"),
+        radius=config["knn"].get("radius")
     )
     
     if neighbors_data is None:
         print("Error: Neighbors data was not returned. Exiting.")
         return
 
-    # Extract neighbor county names for visualization (excluding the target county)
-    neighbor_names = neighbors_data[neighbors_data["County"] != target_county]["County"].tolist()
+    if isinstance(target_county, str):
+        # Extract neighbor county names for visualization (excluding the target county)
+        neighbor_names = neighbors_data[neighbors_data["County"] != target_county]["County"].tolist()
+        target_groups = [(target_county, neighbors_data)]
+    else:
+        # The batched result draws every target and its neighbors in one figure
+        neighbor_names = neighbors_data
+        target_groups = list(neighbors_data.groupby("Target", sort=False))
 
     # Visualize 3D metrics space using standardized data
+    # With more than three metrics, plot the first three
+    if plot_data is None:
+        plot_data, plot_metrics = data_std, metrics[:3]
+    else:
+        plot_metrics = plot_data.columns.drop(["avg_cost_per_marker", "County"]).tolist()[:3]
     visualize_3d_neighbors(
-        data_std, 
+        plot_data, 
         target_county=target_county, 
         neighbors=neighbor_names, 
-        metrics=metrics,
+        metrics=plot_metrics,
         county_column="County"
     )
 
-    visualize_3d_with_costs(data_std, metrics=["wetlandd", "pop_d", "roadoverarea"])
+    visualize_3d_with_costs(plot_data, metrics=plot_metrics)
 
-    # Visualize the distribution for the target county's nearest neighbors
-    visualize_target_neighbor_distribution(
-        neighbors_data, 
-        cost_column="avg_cost_per_marker", 
-        county_column="County",
-        target_county=target_county,
-        config=config
+    # Visualize the distribution for each target county's nearest neighbors
+    for target, target_neighbors in target_groups:
+        visualize_target_neighbor_distribution(
+            target_neighbors, 
+            cost_column="avg_cost_per_marker", 
+            county_column="County",
+            target_county=target,
+            config=config
+        )
+
+
+def run_recall_report(data_std, config):
+    """
+    Prints the recall-vs-exact report for the configured approximate backend, if enabled.
+    """
+    knn_config = config["knn"]
+    recall_config = knn_config.get("recall_report")
+    if not recall_config or knn_config.get("backend", "exact") == "exact":
+        return None
+
+    recall_config = recall_config if isinstance(recall_config, dict) else {}
+    metrics = knn_config.get("metrics", ["wetlandd", "pop_d", "roadoverarea"])
+    return neighbor_recall_report(
+        data_std[metrics].values,
+        n_neighbors=knn_config["n_neighbors"],
+        backend=knn_config["backend"],
+        param_grid=recall_config.get("param_grid", [knn_config.get("backend_params", {})]),
+        sample_size=recall_config.get("sample_size", 1000)
     )
 
 
-def run_clustering_analysis(data_std, config):
+def run_clustering_analysis(data, data_std, config, output_file=None):
+    """
+    Clusters the counties and saves their labels. In "fit" mode the clustering is refitted and persisted as a
+    cluster model with stable cluster IDs; in "assign" mode the rows are labeled against the saved model.
+    """
+    output_file = output_file or output_path(config, "data/processed/county_clusters.csv")
+    model_file = config["clustering"].get("model_file", "data/processed/cluster_model.npz")
+
     # Exclude non-numeric columns and any columns we don't want for clustering
     clustering_data = data_std.drop(columns=["County", "avg_cost_per_marker"], errors="ignore")
 
-    # Determine optimal clusters
-    n_clusters = find_optimal_clusters(clustering_data, max_clusters=config["clustering"]["max_clusters"])
+    if config["clustering"].get("mode", "fit") == "assign":
+        if not os.path.exists(model_file):
+            print(f"Error: No cluster model found at {model_file}. Run clustering in 'fit' mode first.")
+            return
+        model = load_cluster_model(model_file)
+        features = model["features"].tolist()
+        missing = [feature for feature in features if feature not in data.columns]
+        if missing:
+            print(f"Error: Columns of the cluster model missing from the data: {missing}")
+            return
+        cluster_labels, centroid_distances = assign_clusters(model, data[features])
+        print(f"Assigned {len(cluster_labels)} counties to the {len(model['centroids'])} clusters of "
+              f"model v{int(model['model_version'])} fitted at {model['fitted_at']}.")
+    else:
+        fitted_labels = fit_clusters(clustering_data, config)
+        if fitted_labels is None:
+            return
+        model = fit_cluster_model(data, clustering_data, fitted_labels, config, output_path(config, model_file), model_file)
+        if model is None:
+            return
+        evaluation_config = config.get("evaluation", {})
+        evaluate_clusters(
+            clustering_data,
+            fitted_labels,
+            metric=evaluation_config.get("metric", "silhouette"),
+            memory_limit_mb=evaluation_config.get("memory_limit_mb", 256),
+            n_jobs=evaluation_config.get("n_jobs", -1)
+        )
+        # Report the fitted clusters under their stable IDs
+        fitted_labels = np.asarray(fitted_labels)
+        cluster_labels = model["cluster_ids"][fitted_labels]
+        centroid_distances = np.linalg.norm(clustering_data.values - model["centroids"][fitted_labels], axis=1)
 
-    # Perform clustering
-    cluster_labels = perform_clustering(clustering_data, n_clusters)
     data_std["Cluster"] = cluster_labels
+    pd.DataFrame({
+        "County": data_std["County"].values,
+        "Cluster": cluster_labels,
+        "CentroidDistance": centroid_distances,
+        "avg_cost_per_marker": data_std["avg_cost_per_marker"].values,
+    }).to_csv(output_file, index=False)
+    print(f"Cluster labels saved to {output_file}")
 
     # Visualize clusters with interactivity
     visualize_clusters_interactive(
@@ -107,33 +247,152 @@ def run_clustering_analysis(data_std, config):
     # Visualize cost distribution for each cluster
     visualize_cost_distribution(data_std, cluster_labels, cost_column="avg_cost_per_marker", name_column="County")
 
-def find_neighbors_for_all(data, data_std, config, output_file="data/raw/county_neighbors.csv"):
+def fit_clusters(clustering_data, config):
     """
-    Find the nearest neighbors for all counties in the dataset and save to a CSV.
+    Fits the configured clustering method and returns the cluster label of each row (None on failure).
     """
-    results = []
+    # Determine optimal clusters, unless the config fixes the number (as batch runs must)
+    n_clusters = config["clustering"].get("n_clusters")
+    if n_clusters is None:
+        n_clusters = find_optimal_clusters(clustering_data, max_clusters=config["clustering"]["max_clusters"])
 
-    # Iterate over all counties in the dataset
-    for county in data_std["County"].unique():
-        print(f"Processing neighbors for: {county}")
-        neighbors_data = find_target_neighbors(
-            data=data,
-            data_std=data_std,
+    # Perform clustering
+    method = config["clustering"].get("method", "k-means")
+    if method == "k-means":
+        return perform_clustering(clustering_data, n_clusters)
+    if method == "birch":
+        cluster_labels, _ = perform_incremental_clustering(
+            clustering_data,
+            n_clusters,
+            chunk_size=config["clustering"].get("chunk_size", 1000),
+            threshold=config["clustering"].get("threshold", 0.5),
+            branching_factor=config["clustering"].get("branching_factor", 50)
+        )
+        return cluster_labels
+    print(f"Unknown clustering method: {method}")
+    return None
+
+def fit_cluster_model(data, clustering_data, cluster_labels, config, model_file, previous_file=None):
+    """
+    Persists freshly fitted clusters as a cluster model (scaler, projection, centroids and a version stamp).
+    Cluster IDs are aligned with the previously saved model so that the same clusters keep the same IDs:
+    the model at `model_file`, or else the one at `previous_file` (the configured model when batch runs
+    write to their own directory).
+    """
+    features = config.get("include_columns", ["pop_d", "roadoverarea", "wetlandd"])
+    method = config["standardization"]["method"]
+    projection = None
+    projection_config = config.get("projection", {})
+    if projection_config.get("enabled", False):
+        projection = load_projection(
+            output_path(config, projection_config.get("cache", "data/processed/projection.npz")), features,
+            target_variance=projection_config.get("target_variance", 0.95),
+            n_components=projection_config.get("n_components"),
+            standardization=method
+        )
+        if projection is None:
+            print("Error: A cluster model with a projection requires the projection cache (projection.cache).")
+            return None
+
+    center, scale = scaling_parameters(data[features], method)
+    model = build_cluster_model(
+        clustering_data.values, np.asarray(cluster_labels), center, scale, features, method,
+        config["clustering"].get("method", "k-means"), projection
+    )
+
+    previous_file = model_file if os.path.exists(model_file) or previous_file is None else previous_file
+    if os.path.exists(previous_file):
+        previous = load_cluster_model(previous_file)
+        if previous["features"].tolist() == features:
+            model = align_cluster_ids(model, previous)
+            print(f"Cluster IDs aligned with model v{int(previous['model_version'])}.")
+        else:
+            model["model_version"] = np.asarray(int(previous["model_version"]) + 1)
+            print("Cluster model features changed; cluster IDs start fresh.")
+    save_cluster_model(model, model_file)
+    return model
+
+def run_cluster_stability(data_std, config, output_file=None):
+    """
+    Scores the stability of each candidate number of clusters on bootstrap resamples and saves the
+    per-k scores and the per-county assignment confidence.
+    """
+    output_file = output_file or output_path(config, "data/processed/cluster_stability.csv")
+    stability_config = config["clustering"].get("stability", {})
+    clustering_data = data_std.drop(columns=["County", "avg_cost_per_marker"], errors="ignore")
+
+    scores, confidence, _ = cluster_stability(
+        clustering_data,
+        k_values=stability_config.get("k_values", range(2, config["clustering"]["max_clusters"] + 1)),
+        n_resamples=stability_config.get("n_resamples", 200),
+        chunk_size=stability_config.get("chunk_size", 25),
+        n_jobs=stability_config.get("n_jobs", -1),
+        random_state=stability_config.get("random_state", 42),
+        labels=data_std["County"].values,
+        null_reference=stability_config.get("null_reference", True)
+    )
+
+    scores.to_csv(output_file, index=False)
+    confidence_file = output_file.replace(".csv", "_confidence.csv")
+    confidence.rename(columns=lambda k: f"k{k}").rename_axis("County").to_csv(confidence_file)
+    print(f"Cluster stability scores saved to {output_file} and per-county confidence to {confidence_file}")
+    return scores, confidence
+
+def find_neighbors_for_all(data, data_std, config, output_file=None):
+    """
+    Find the nearest neighbors for all counties in the dataset and save to a CSV.
+    """
+    output_file = output_file or output_path(config, "data/raw/county_neighbors.csv")
+    if config["knn"].get("incremental", False):
+        conflicts = incremental_conflicts(config)
+        if not conflicts:
+            return update_neighbors_for_all(data, config, output_file)
+        print(f"Warning: knn.incremental does not support {', '.join(conflicts)}; recomputing all neighbors instead.")
+
+    run_recall_report(data_std, config)
+    spatial_graph = load_spatial_graph(config)
+    if spatial_graph is None:
+        # One index and one batched query for all counties
+        all_neighbors = find_all_neighbors(
+            data_std,
             cost_column="avg_cost_per_marker",
             county_column="County",
-            target_county=county,
             n_neighbors=config["knn"]["n_neighbors"],
             metrics=config["knn"]["metrics"],
-            verbose=config["knn"].get("verbose", False)
+            query_mode=config["knn"].get("query_mode", "k"),
+            radius=config["knn"].get("radius"),
+            backend=config["knn"].get("backend", "exact"),
+            backend_params=config["knn"].get("backend_params")
         )
-
-        if neighbors_data is not None:
-            # Add source county to the results
-            neighbors_data["SourceCounty"] = county
-            results.append(neighbors_data)
-
-    # Combine all results into a single DataFrame
-    all_neighbors = pd.concat(results, ignore_index=True)
+    else:
+        # Spatial candidates differ per county, so each county is queried separately
+        results = []
+        for county in data_std["County"].unique():
+            print(f"Processing neighbors for: {county}")
+            neighbors_data = find_target_neighbors(
+                data=data,
+                data_std=data_std,
+                cost_column="avg_cost_per_marker",
+                county_column="County",
+                target_county=county,
+                n_neighbors=config["knn"]["n_neighbors"],
+                metrics=config["knn"]["metrics"],
+                verbose=config["knn"].get("verbose", False),
+                backend=config["knn"].get("backend", "exact"),
+                backend_params=config["knn"].get("backend_params"),
+                spatial=spatial_graph,
+                spatial_options=config.get("spatial"),
+                query_mode=config["knn"].get("query_mode", "k"),
+                radius=config["knn"].get("radius")
+            )
+
+            if neighbors_data is not None:
+                # Add source county to the results
+                neighbors_data["SourceCounty"] = county
+                results.append(neighbors_data)
+
+        # Combine all results into a single DataFrame
+        all_neighbors = pd.concat(results, ignore_index=True)
 
     # Save to CSV
     all_neighbors.to_csv(output_file, index=False)
@@ -142,68 +401,342 @@ def find_neighbors_for_all(data, data_std, config, output_file="data/raw/county_
     return all_neighbors
 
 
-def run_pipeline(config):
-    # Merge data from raw files
-    merged_data_path = "data/processed/merged_county_data.csv"
-    merge_county_data(
-        config["file_paths"]["state_survey"],
-        config["file_paths"]["population"],
-        config["file_paths"]["road"],
-        config["file_paths"]["wetlands"]
-    ).to_csv(merged_data_path, index=False)
-
-    # Load merged data
-    data = load_csv(merged_data_path)
-    if data is None:
-        print("Exiting pipeline due to data loading error.")
+def incremental_conflicts(config):
+    """
+    Lists the configured neighbor settings that the incremental table cannot honor: it always finds the
+    exact k nearest counties in the standardized knn metrics.
+    """
+    knn_config = config["knn"]
+    conflicts = []
+    if knn_config.get("query_mode", "k") != "k":
+        conflicts.append(f"query_mode '{knn_config['query_mode']}'")
+    if knn_config.get("backend", "exact") != "exact":
+        conflicts.append(f"backend '{knn_config['backend']}'")
+    if config.get("spatial", {}).get("enabled", False):
+        conflicts.append("spatial neighbors")
+    return conflicts
+
+
+def update_neighbors_for_all(data, config, output_file):
+    """
+    Maintains the all-counties neighbor table incrementally: the state saved by the previous run is diffed
+    against the current data and only the affected counties are recomputed.
+    """
+    state_file = output_path(config, config["knn"].get("state_file", "data/processed/county_neighbors_state.npz"))
+    metrics = config["knn"]["metrics"]
+    n_neighbors = config["knn"]["n_neighbors"]
+    method = config["standardization"]["method"]
+
+    state = load_neighbor_state(state_file) if os.path.exists(state_file) else None
+    if state is not None and (state["metrics"].tolist() != metrics or int(state["n_neighbors"]) != n_neighbors
+                              or str(state["method"]) != method):
+        print("Neighbor settings changed since the last run; rebuilding the neighbor table.")
+        state = None
+
+    if state is None:
+        state = build_neighbor_state(data, metrics, n_neighbors, method, "avg_cost_per_marker", "County")
+    else:
+        state, _ = update_neighbor_state(state, data, drift_tolerance=config["knn"].get("drift_tolerance", 0.01))
+    save_neighbor_state(state, state_file)
+
+    all_neighbors = neighbor_table(state)
+    all_neighbors.to_csv(output_file, index=False)
+    print(f"All counties' nearest neighbors saved to {output_file}")
+    return all_neighbors
+
+
+def run_neighbor_graph(data, data_std, config, output_file=None):
+    """
+    Builds the sparse kNN graph from the all-counties neighbor results and saves the per-county graph
+    analytics (reverse-kNN counts, hubs, mutual-neighbor components), the mutual pairs and the CSR matrix.
+    """
+    output_file = output_file or output_path(config, "data/processed/neighbor_graph.csv")
+    all_neighbors = find_neighbors_for_all(data, data_std, config)
+    graph, counties = neighbor_graph(all_neighbors)
+    per_county, pairs, _ = neighbor_graph_report(graph, counties, hub_threshold=config.get("graph", {}).get("hub_threshold", 2.0))
+
+    per_county.to_csv(output_file, index=False)
+    pairs_file = output_file.replace(".csv", "_mutual_pairs.csv")
+    pairs.to_csv(pairs_file, index=False)
+    matrix_file = output_file.replace(".csv", ".npz")
+    sp.save_npz(matrix_file, graph)
+    print(per_county.sort_values("reverse_knn_count", ascending=False).head(10).to_string(index=False))
+    print(f"Neighbor graph analytics saved to {output_file}, mutual pairs to {pairs_file} and the CSR matrix to {matrix_file}")
+    return per_county, pairs
+
+
+def run_knn_prediction(data_std, config, output_file=None):
+    """
+    Predicts every county's cost from its neighbors (leave-one-out) and reports MAE/RMSE per k.
+    """
+    output_file = output_file or output_path(config, "data/processed/knn_cost_predictions.csv")
+    predictions, scores = predict_costs_loo(
+        data_std,
+        cost_column="avg_cost_per_marker",
+        county_column="County",
+        metrics=config["knn"].get("metrics", ["wetlandd", "pop_d", "roadoverarea"]),
+        k_values=config["knn"].get("k_values", [config["knn"]["n_neighbors"]]),
+        backend=config["knn"].get("backend", "exact"),
+        backend_params=config["knn"].get("backend_params")
+    )
+
+    predictions.to_csv(output_file, index=False)
+    print(f"Leave-one-out cost predictions saved to {output_file}")
+    return predictions, scores
+
+
+def run_neighbor_statistics(data_std, config, output_file=None):
+    """
+    Computes bootstrap confidence intervals for the median and IQR of every county's neighbor-group cost.
+    """
+    output_file = output_file or output_path(config, "data/processed/neighbor_cost_intervals.csv")
+    stats_config = config.get("statistics", {})
+    intervals = bootstrap_neighbor_statistics(
+        data_std,
+        cost_column="avg_cost_per_marker",
+        county_column="County",
+        metrics=config["knn"].get("metrics", ["wetlandd", "pop_d", "roadoverarea"]),
+        n_neighbors=config["knn"]["n_neighbors"],
+        n_resamples=stats_config.get("n_resamples", 10000),
+        confidence=stats_config.get("confidence", 0.95),
+        include_target=stats_config.get("include_target", False),
+        memory_limit_mb=stats_config.get("memory_limit_mb", 256),
+        n_jobs=stats_config.get("n_jobs", -1),
+        random_state=stats_config.get("random_state", 42),
+        backend=config["knn"].get("backend", "exact"),
+        backend_params=config["knn"].get("backend_params")
+    )
+
+    intervals.to_csv(output_file, index=False)
+    print(f"Neighbor cost confidence intervals saved to {output_file}")
+    return intervals
+
+
+def run_permutation_test(data_std, config, output_file=None):
+    """
+    Tests whether each county's neighbors are more alike in cost than random groups of the same size.
+    """
+    output_file = output_file or output_path(config, "data/processed/neighbor_permutation_test.csv")
+    stats_config = config.get("statistics", {})
+    per_county, overall = neighbor_permutation_test(
+        data_std,
+        cost_column="avg_cost_per_marker",
+        county_column="County",
+        metrics=config["knn"].get("metrics", ["wetlandd", "pop_d", "roadoverarea"]),
+        n_neighbors=config["knn"]["n_neighbors"],
+        n_permutations=stats_config.get("n_permutations", 10000),
+        dispersion=stats_config.get("dispersion", "std"),
+        memory_limit_mb=stats_config.get("memory_limit_mb", 256),
+        n_jobs=stats_config.get("n_jobs", -1),
+        random_state=stats_config.get("random_state", 42),
+        backend=config["knn"].get("backend", "exact"),
+        backend_params=config["knn"].get("backend_params")
+    )
+
+    per_county.to_csv(output_file, index=False)
+    print(f"Per-county permutation test results saved to {output_file}")
+    return per_county, overall
+
+
+def ingest_history(config):
+    """
+    Ingests every configured survey cycle into the history store. Cycles that are already stored are skipped.
+    """
+    history_config = config.get("history", {})
+    store_path = history_config.get("path", "data/history")
+    for year, source_path in history_config.get("sources", {}).items():
+        ingest_cycle(source_path, int(year), store_path)
+    return store_path
+
+
+def load_survey_cycle(config):
+    """
+    Returns the survey of the configured history cycle, or None to use file_paths.state_survey.
+    """
+    cycle = config.get("history", {}).get("cycle")
+    if cycle is None:
+        return None
+    store_path = ingest_history(config)
+    return load_cycle(int(cycle), store_path=store_path)
+
+
+def run_cycle_deltas(config, output_file=None):
+    """
+    Computes the cycle-over-cycle change in cost per corner between two stored survey cycles.
+    """
+    history_config = config.get("history", {})
+    store_path = ingest_history(config)
+    from_year, to_year = history_config["delta_from"], history_config["delta_to"]
+    output_file = output_file or output_path(config, f"data/processed/cycle_deltas_{from_year}_{to_year}.csv")
+
+    deltas = cycle_deltas(
+        from_year,
+        to_year,
+        column=history_config.get("delta_column", "Average Spent per Corner Completed"),
+        store_path=store_path
+    )
+    deltas.to_csv(output_file, index=False)
+    print(f"Cycle-over-cycle deltas saved to {output_file}")
+    return deltas
+
+
+def load_corner_statistics(config):
+    """
+    Aggregates the corner-level records in file_paths.corners, if configured, into county statistics.
+    """
+    corners_path = config["file_paths"].get("corners")
+    if not corners_path:
+        return None
+    corner_config = config.get("corners", {})
+    return aggregate_corners(
+        corners_path,
+        county_column=corner_config.get("county_column", "County"),
+        cost_column=corner_config.get("cost_column", "Cost"),
+        completed_column=corner_config.get("completed_column", "Completed"),
+        chunksize=corner_config.get("chunksize", 1_000_000),
+        percentiles=corner_config.get("percentiles", [25, 50, 75, 90])
+    )
+
+
+def analysis_columns(config):
+    """
+    Returns the merged-data columns used by the configured analyses; the rest are dropped after loading.
+    """
+    columns = ["County", "Average Spent per Corner Completed"]
+    columns += config.get("include_columns", ["pop_d", "roadoverarea", "wetlandd"])
+    columns += config["knn"].get("metrics", [])
+    # The model is an input in assign mode, so it is read from the configured path (not the output directory)
+    model_file = config["clustering"].get("model_file", "data/processed/cluster_model.npz")
+    if config["clustering"].get("mode", "fit") == "assign" and os.path.exists(model_file):
+        columns += load_cluster_model(model_file)["features"].tolist()
+    return list(dict.fromkeys(columns))
+
+
+def run_pipeline(config, merged_data=None):
+    """
+    Runs the configured analysis. If `merged_data` is given (e.g. by batch.py), it is used instead of
+    merging and reloading the raw files.
+    """
+    visualization_config = config.get("visualization", {})
+    set_figure_cache(
+        visualization_config.get("figure_cache", "data/processed/figure_cache"),
+        max_mb=visualization_config.get("figure_cache_mb", 200)
+    )
+
+    analysis_type = config.get("analysis_type", "knn")
+    if analysis_type == "cycle_deltas":
+        run_cycle_deltas(config)
         return
 
+    if merged_data is None:
+        # Merge data from raw files, taking the survey from the history store when a cycle is selected
+        survey_cycle = load_survey_cycle(config)
+        merged_data_path = "data/processed/merged_county_data.csv"
+        if survey_cycle is not None:
+            merged_data_path = f"data/processed/merged_county_data_{config['history']['cycle']}.csv"
+        merge_county_data(
+            config["file_paths"]["state_survey"],
+            config["file_paths"]["population"],
+            config["file_paths"]["road"],
+            config["file_paths"]["wetlands"],
+            state_survey=survey_cycle,
+            corner_stats=load_corner_statistics(config),
+            max_workers=config.get("ingest_workers", 4)
+        ).to_csv(merged_data_path, index=False)
+
+        # Load merged data
+        data = load_csv(merged_data_path, schema="merged")
+        if data is None:
+            print("Exiting pipeline due to data loading error.")
+            return
+    else:
+        # Shallow copy so added columns never touch the caller's frame
+        data = merged_data.copy(deep=False)
+
     # Apply filtering based on config
     data = filter_data(data, config)
     
     # Verify that the target county is still in the data after filtering
     target_county = config["knn"]["target_county"]
-    if target_county not in data["County"].values:
+    targets = [target_county] if isinstance(target_county, str) else list(target_county)
+    filtered_out = [target for target in targets if target not in data["County"].values]
+    if len(filtered_out) == len(targets):
         print(f"Error: Target county '{target_county}' was filtered out. Check filter criteria.")
         return  # Exit early if target county is missing
+    if filtered_out:
+        print(f"Warning: Target counties {filtered_out} were filtered out and are skipped.")
 
-    # Extract columns for reference
-    county_names = data["County"]
-    cost_per_corner = data["Average Spent per Corner Completed"]
+    # Keep only the columns the analyses use, in compact dtypes
+    data = compact_frame(data, analysis_columns(config)).rename(
+        columns={"Average Spent per Corner Completed": "avg_cost_per_marker"}
+    )
 
     # Preprocess: Standardize only the clustering features
-    features_to_standardize = data[["pop_d", "roadoverarea", "wetlandd"]]
+    include_columns = config.get("include_columns", ["pop_d", "roadoverarea", "wetlandd"])
+    missing_columns = [column for column in include_columns if column not in data.columns]
+    if missing_columns:
+        print(f"Error: include_columns not found in the merged data: {missing_columns}")
+        return
+    features_to_standardize = data[include_columns]
     data_std = standardize(features_to_standardize, method=config["standardization"]["method"])
     if data_std is None:
         print("Exiting pipeline due to preprocessing error.")
         return
 
-    # Add the reference columns back to the standardized data
-    data_std["avg_cost_per_marker"] = cost_per_corner
-    data_std["County"] = county_names
+    # Optionally replace the standardized features by their principal components
+    projection_config = config.get("projection", {})
+    plot_data = None
+    if projection_config.get("enabled", False):
+        # The 3D figures keep showing the standardized knn metrics rather than the components
+        plot_metrics = [metric for metric in config["knn"].get("metrics", []) if metric in data_std.columns]
+        plot_data = data_std[plot_metrics]
+        data_std = project(
+            data_std,
+            target_variance=projection_config.get("target_variance", 0.95),
+            n_components=projection_config.get("n_components"),
+            cache_path=output_path(config, projection_config.get("cache", "data/processed/projection.npz")),
+            rebuild=projection_config.get("rebuild", False),
+            standardization=config["standardization"]["method"]
+        )
+        # Neighbor searches then run on the components; the incremental table works on raw metrics only
+        config = dict(config, knn=dict(config["knn"], metrics=data_std.columns.tolist(), incremental=False))
+
+    # Reference columns of data_std share their memory with data (copy-on-write)
+    data_std["avg_cost_per_marker"] = data["avg_cost_per_marker"]
+    data_std["County"] = data["County"]
+    if plot_data is not None:
+        plot_data = plot_data.assign(avg_cost_per_marker=data["avg_cost_per_marker"], County=data["County"])
 
     # Verify that no NaN values are in the 'County' column after assignment
     if data_std["County"].isnull().any():
         print("Error: NaN values detected in 'County' column of data_std after assignment.")
         return  # Exit if data is invalid
-
-    # Keep original data columns intact in 'data' for any raw-data analysis
-    data["County"] = county_names
-    data["avg_cost_per_marker"] = cost_per_corner
+    memory_report(data=data, data_std=data_std)
 
     # Run the selected analysis based on config
-    analysis_type = config.get("analysis_type", "knn")
     if analysis_type == "knn":
-        run_knn_analysis(data, data_std, config)
+        run_knn_analysis(data, data_std, config, plot_data=plot_data)
     elif analysis_type == "clustering":
-        run_clustering_analysis(data_std, config)
+        run_clustering_analysis(data, data_std, config)
+    elif analysis_type == "cluster_stability":
+        run_cluster_stability(data_std, config)
     elif analysis_type == "all_neighbors":
         find_neighbors_for_all(data, data_std, config)
+    elif analysis_type == "neighbor_graph":
+        run_neighbor_graph(data, data_std, config)
+    elif analysis_type == "knn_prediction":
+        run_knn_prediction(data_std, config)
+    elif analysis_type == "neighbor_statistics":
+        run_neighbor_statistics(data_std, config)
+    elif analysis_type == "permutation_test":
+        run_permutation_test(data_std, config)
     else:
         print(f"Unknown analysis type: {analysis_type}")
 
 
-
-
 if __name__ == "__main__":
+    # Load configuration file
+    with open("config.json", "r") as f:
+        config = json.load(f)
+
     run_pipeline(config)
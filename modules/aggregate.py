@@ -0,0 +1,132 @@
+# modules/aggregate.py
+import time
+import numpy as np
+import pandas as pd
+from modules.load_data import CSV_ENGINE
+
+# Truthy spellings of the completion flag in corner records
+COMPLETED_VALUES = ["1", "true", "yes", "y", "completed", "complete"]
+
+
+def _completion_flags(values):
+    """Parses a completion column (bool, 0/1 or yes/no text) into a boolean array."""
+    if pd.api.types.is_bool_dtype(values) or pd.api.types.is_numeric_dtype(values):
+        return values.fillna(0).to_numpy().astype(bool)
+    return values.astype(str).str.strip().str.lower().isin(COMPLETED_VALUES).to_numpy()
+
+
+def _group_quantiles(codes, costs, n_counties, percentiles):
+    """
+    Exact per-county percentiles: one sort by (county, cost), then linear interpolation at each
+    county's offsets (numpy's default "linear" method).
+    """
+    order = np.lexsort((costs, codes))
+    codes, costs = codes[order], costs[order]
+    counts = np.bincount(codes, minlength=n_counties)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+
+    quantiles = np.full((n_counties, len(percentiles)), np.nan)
+    present = counts > 0
+    for j, percentile in enumerate(percentiles):
+        position = (counts[present] - 1) * percentile / 100
+        lower = np.floor(position).astype(int)
+        upper = np.minimum(lower + 1, counts[present] - 1)
+        fraction = position - lower
+        base = starts[present]
+        quantiles[present, j] = (
+            costs[base + lower] * (1 - fraction) + costs[base + upper] * fraction
+        )
+    return quantiles
+
+
+def aggregate_corners(corners_path, county_column="County", cost_column="Cost", completed_column="Completed",
+                      chunksize=1_000_000, percentiles=(25, 50, 75, 90)):
+    """
+    Streams corner-level records and aggregates them into county-level statistics in the merged schema.
+
+    The file is read in chunks; county names are integer-coded as they are first seen and every chunk is
+    reduced with bincount over the codes, so only per-county totals and the completed corners' costs
+    (for the percentiles) are kept between chunks.
+
+    Parameters:
+    - corners_path (str): CSV with one row per corner.
+    - county_column (str): Column holding the county name.
+    - cost_column (str): Column holding the amount spent on the corner (blank if not completed).
+    - completed_column (str): Column flagging completed corners (bool, 0/1 or yes/no).
+    - chunksize (int): Rows read per chunk.
+    - percentiles (list): Percentiles of the cost per completed corner. The 50th is reported as the median.
+
+    Returns:
+    - pd.DataFrame: One row per county with "County", "Total Remon Corners in County", "Remon Corners Completed",
+      "Percent Remon Corners Completed", "Average Spent per Corner Completed", "Median Spent per Corner Completed",
+      "P<q> Spent per Corner Completed" for the other percentiles, and "Total Spent on Completed Corners".
+    """
+    start = time.perf_counter()
+    county_codes = {}
+    total = np.zeros(0, dtype=np.int64)
+    completed = np.zeros(0, dtype=np.int64)
+    cost_count = np.zeros(0, dtype=np.int64)
+    cost_sum = np.zeros(0)
+    cost_codes, cost_values = [], []
+    n_rows = 0
+
+    reader = pd.read_csv(
+        corners_path,
+        usecols=[county_column, cost_column, completed_column],
+        dtype={county_column: str, cost_column: "float64"},
+        chunksize=chunksize,
+        engine="c" if CSV_ENGINE == "pyarrow" else CSV_ENGINE,  # the pyarrow engine does not support chunksize
+    )
+    for chunk in reader:
+        chunk = chunk[chunk[county_column].notna()]
+        n_rows += len(chunk)
+
+        # Map the chunk's county names onto the global integer codes
+        local_codes, names = pd.factorize(chunk[county_column].str.strip())
+        for name in names:
+            county_codes.setdefault(name, len(county_codes))
+        codes = np.array([county_codes[name] for name in names], dtype=np.int32)[local_codes]
+
+        n_counties = len(county_codes)
+        if n_counties > len(total):
+            grow = n_counties - len(total)
+            total = np.concatenate([total, np.zeros(grow, dtype=np.int64)])
+            completed = np.concatenate([completed, np.zeros(grow, dtype=np.int64)])
+            cost_count = np.concatenate([cost_count, np.zeros(grow, dtype=np.int64)])
+            cost_sum = np.concatenate([cost_sum, np.zeros(grow)])
+
+        is_completed = _completion_flags(chunk[completed_column])
+        costs = chunk[cost_column].to_numpy()
+        has_cost = is_completed & np.isfinite(costs)
+
+        total += np.bincount(codes, minlength=n_counties)
+        completed += np.bincount(codes, weights=is_completed, minlength=n_counties).astype(np.int64)
+        cost_count += np.bincount(codes[has_cost], minlength=n_counties)
+        cost_sum += np.bincount(codes[has_cost], weights=costs[has_cost], minlength=n_counties)
+        cost_codes.append(codes[has_cost])
+        cost_values.append(costs[has_cost])
+
+    if not county_codes:
+        raise ValueError(f"No corner records found in {corners_path}.")
+
+    n_counties = len(county_codes)
+    percentiles = sorted(set(percentiles) | {50})
+    quantiles = _group_quantiles(np.concatenate(cost_codes), np.concatenate(cost_values), n_counties, percentiles)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        statistics = pd.DataFrame({
+            "County": list(county_codes),
+            "Total Remon Corners in County": total.astype(np.int32),
+            "Remon Corners Completed": completed.astype(np.int32),
+            "Percent Remon Corners Completed": (completed / total).astype(np.float32),
+            "Average Spent per Corner Completed": cost_sum / cost_count,
+            "Total Spent on Completed Corners": cost_sum,
+        })
+    for j, percentile in enumerate(percentiles):
+        name = "Median" if percentile == 50 else f"P{percentile:g}"
+        statistics[f"{name} Spent per Corner Completed"] = quantiles[:, j]
+
+    statistics = statistics.sort_values("County").reset_index(drop=True)
+    print(f"Aggregated {n_rows} corner records into {n_counties} counties "
+          f"in {time.perf_counter() - start:.2f}s")
+    return statistics
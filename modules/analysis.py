@@ -1,8 +1,10 @@
 # modules/analysis.py
-from sklearn.neighbors import NearestNeighbors
+import numpy as np
 import pandas as pd
+from modules.neighbors import build_neighbor_index
+from modules.spatial import spatial_candidates, geographic_distances, missing_counties
 
-def find_nearest_neighbors(data, cost_column="avg_cost_per_marker", n_neighbors=5):
+def find_nearest_neighbors(data, cost_column="avg_cost_per_marker", n_neighbors=5, backend="exact", backend_params=None):
     """
     Finds the nearest neighbors for each data point and extracts the cost per marker of these neighbors.
 
@@ -10,19 +12,23 @@ def find_nearest_neighbors(data, cost_column="avg_cost_per_marker", n_neighbors=
     - data (pd.DataFrame): Standardized data used in clustering.
     - cost_column (str): Column representing the cost per marker.
     - n_neighbors (int): Number of nearest neighbors to find.
+    - backend (str): Neighbor search backend ("exact" or "ivf").
+    - backend_params (dict): Parameters for the selected backend.
 
     Returns:
     - pd.DataFrame: Original data with an additional column for neighbor cost distributions.
     """
-    # Initialize Nearest Neighbors model
-    nbrs = NearestNeighbors(n_neighbors=n_neighbors + 1, algorithm='auto').fit(data)
-    distances, indices = nbrs.kneighbors(data)
+    # Build the neighbor index with the selected backend
+    index = build_neighbor_index(data, backend=backend, backend_params=backend_params)
+    distances, indices = index.kneighbors(data, n_neighbors + 1)
 
     # Collect cost per marker distributions for each data point's neighbors
     neighbor_costs = []
     for i, neighbors in enumerate(indices):
-        # Exclude the point itself (first neighbor in the result) and get cost for actual neighbors
-        neighbor_cost = data.iloc[neighbors[1:]][cost_column].values
+        # Exclude the point itself (first neighbor in the result) and get cost for actual neighbors;
+        # -1 marks missing neighbors (an approximate index may return fewer than requested)
+        neighbors = neighbors[1:]
+        neighbor_cost = data.iloc[neighbors[neighbors >= 0]][cost_column].values
         neighbor_costs.append(neighbor_cost)
 
     # Add the neighbor costs as a new column to the original data
@@ -30,7 +36,61 @@ def find_nearest_neighbors(data, cost_column="avg_cost_per_marker", n_neighbors=
     return data
 
 
-# modules/analysis.py
+QUERY_MODES = ["k", "radius", "k_capped"]
+
+
+def _check_query_mode(query_mode, radius):
+    if query_mode not in QUERY_MODES:
+        raise ValueError(f"Unknown query mode '{query_mode}'. Options: {QUERY_MODES}")
+    if query_mode != "k" and radius is None:
+        raise ValueError(f"Query mode '{query_mode}' requires a radius.")
+
+
+def _inverse_distance_weights(distances, groups=None):
+    """Inverse-distance weights normalized to sum to 1 within each group (a single group by default)."""
+    weights = 1.0 / np.maximum(distances, 1e-12)
+    if groups is None:
+        return weights / weights.sum() if len(weights) else weights
+    return weights / np.bincount(groups, weights=weights)[groups]
+
+
+def _query_neighbors(index, queries, self_positions, n_neighbors, query_mode="k", radius=None):
+    """
+    Queries the neighbors of several rows of the indexed data, excluding each row itself.
+
+    Returns:
+    - tuple: Flat arrays (query number, neighbor position, distance), nearest first within each query.
+    """
+    if query_mode == "radius":
+        distances, indices = index.radius_neighbors(queries, radius)
+        lengths = np.array([len(row) for row in indices], dtype=int)
+        sources = np.repeat(np.arange(len(queries)), lengths)
+        distances = np.concatenate(list(distances) + [np.zeros(0)])
+        indices = np.concatenate(list(indices) + [np.zeros(0, dtype=int)]).astype(int)
+        keep = indices != self_positions[sources]
+        return sources[keep], indices[keep], distances[keep]
+
+    distances, indices = _without_self(*index.kneighbors(queries, n_neighbors + 1), self_positions)
+    keep = indices >= 0
+    if query_mode == "k_capped":
+        keep &= distances <= radius
+    sources = np.broadcast_to(np.arange(len(queries))[:, None], indices.shape)
+    return sources[keep], indices[keep], distances[keep]
+
+
+def _without_self(distances, indices, self_positions):
+    """
+    Drops each row from its own (k + 1)-neighbor list, or the farthest hit if the row was not returned.
+
+    Returns:
+    - tuple: (distances, indices) with one column fewer.
+    """
+    is_self = indices == self_positions[:, None]
+    is_self[~is_self.any(axis=1), -1] = True
+    is_self &= np.cumsum(is_self, axis=1) == 1
+    shape = (indices.shape[0], indices.shape[1] - 1)
+    return distances[~is_self].reshape(shape), indices[~is_self].reshape(shape)
+
 
 def find_target_neighbors(data, data_std,
     cost_column="avg_cost_per_marker",
@@ -38,10 +98,36 @@ def find_target_neighbors(data, data_std,
     target_county="Van Buren",
     n_neighbors=5,
     metrics=["wetlandd", "pop_d", "roadoverarea"],
-    verbose=False):
+    verbose=False,
+    backend="exact",
+    backend_params=None,
+    spatial=None,
+    spatial_options=None,
+    query_mode="k",
+    radius=None):
     """
     Finds the nearest neighbors of a specified target county using standardized data and specified metrics, and extracts the original cost per marker.
-    Includes the target county in the returned DataFrame.
+    Includes the target county in the returned DataFrame, followed by its neighbors from nearest to farthest,
+    with their feature-space `Distance` and inverse-distance `Weight` (normalized to sum to 1 over the neighbors).
+
+    `target_county` may also be a list of counties. The index is then fitted once and all targets are queried
+    in one batched call; the result stacks each target's rows (target first, then its neighbors) with a
+    `Target` column naming the target they belong to. Targets missing from the data are reported and skipped.
+
+    `query_mode` selects which neighbors are returned:
+    - "k": the n_neighbors nearest counties.
+    - "radius": every county within `radius` (in standardized units), however many there are.
+    - "k_capped": the n_neighbors nearest counties, dropping those farther than `radius`.
+
+    The neighbor search backend is selected with `backend` ("exact" or the approximate "ivf")
+    and tuned with `backend_params` (see modules/neighbors.py).
+
+    If a county graph from modules/spatial.py is passed as `spatial`, geography is taken into account
+    according to `spatial_options`:
+    - {"mode": "constrain", "max_distance_km": ..., "max_hops": 1}: only counties within the centroid
+      distance (or, without a distance, within max_hops contiguity steps) can be neighbors.
+    - {"mode": "blend", "weight": 1.0}: neighbors are ranked by feature distance plus weight times the
+      centroid distance divided by the graph's cutoff distance.
     """
     def log(message):
         """Helper function to print messages if verbose is enabled."""
@@ -61,6 +147,12 @@ def find_target_neighbors(data, data_std,
         log(f"Error: Missing columns in data_std - {e}")
         return None
 
+    if not isinstance(target_county, str):
+        return _find_many_target_neighbors(
+            data, data_for_knn, cost_column, county_column, list(target_county), n_neighbors, metrics,
+            verbose, backend, backend_params, spatial, spatial_options, query_mode, radius
+        )
+
     # Find the index of the target county
     try:
         target_index = data_for_knn.index[data_for_knn[county_column] == target_county][0]
@@ -79,27 +171,61 @@ def find_target_neighbors(data, data_std,
         log(f"{knn_data[knn_data.isnull().any(axis=1)]}")
     else:
         log("Step 5: No NaN values detected in knn_data.")
-    # Initialize Nearest Neighbors model on the selected metrics
-    nbrs = NearestNeighbors(n_neighbors=n_neighbors + 1, algorithm='auto').fit(knn_data)
-    log("Step 5: NearestNeighbors model initialized and fitted.")
+    _check_query_mode(query_mode, radius)
+    spatial_options = spatial_options or {}
+    spatial_mode = spatial_options.get("mode", "constrain") if spatial is not None else None
+    if spatial is not None:
+        missing = missing_counties(spatial, knn_data.index)
+        if missing:
+            print(f"Error: Counties not found in the county graph: {missing}")
+            return None
+    if spatial_mode == "constrain":
+        # Only geographically eligible counties (and the target) can be neighbors
+        eligible = spatial_candidates(
+            spatial, target_county, knn_data.index,
+            max_distance_km=spatial_options.get("max_distance_km"),
+            max_hops=spatial_options.get("max_hops", 1)
+        )
+        knn_data = knn_data[eligible]
+        log(f"Step 5b: Spatial constraint leaves {len(knn_data) - 1} candidate counties.")
 
-    try:
-        distances, indices = nbrs.kneighbors(knn_data.loc[[target_county]])
-        log(f"Step 6: Nearest neighbors found. Indices: {indices}")
-    except KeyError as e:
-        log(f"Error: Target county '{target_county}' not found in knn_data. Available counties: {knn_data.index.tolist()}")
-        return None
+    target_position = knn_data.index.get_loc(target_county)
+    if spatial_mode == "blend":
+        # Rank by feature distance plus weighted centroid distance (scaled by the graph's cutoff)
+        feature_distances = np.linalg.norm(knn_data.values - knn_data.loc[[target_county]].values, axis=1)
+        # Pairs beyond the graph's cutoff all get the cutoff distance
+        geo_distances = np.minimum(geographic_distances(spatial, [target_county], knn_data.index)[0] / spatial["max_distance_km"], 1.0)
+        blended = feature_distances + spatial_options.get("weight", 1.0) * geo_distances
+        neighbor_indices = np.argsort(blended, kind="stable")
+        neighbor_indices = neighbor_indices[neighbor_indices != target_position]
+        if query_mode != "radius":
+            neighbor_indices = neighbor_indices[:n_neighbors]
+        if query_mode != "k":
+            neighbor_indices = neighbor_indices[feature_distances[neighbor_indices] <= radius]
+        neighbor_distances = feature_distances[neighbor_indices]
+        log(f"Step 6: Blended feature/geographic neighbors found: {neighbor_indices}")
+    else:
+        # Build the neighbor index on the selected metrics
+        index = build_neighbor_index(knn_data.values, backend=backend, backend_params=backend_params)
+        log(f"Step 5: '{backend}' neighbor index built and fitted.")
 
-    # Get the indices of the nearest neighbors (excluding the target county itself)
-    neighbor_indices = indices[0][1:]
-    log(f"Step 7: Neighbor indices (excluding target): {neighbor_indices}")
+        _, neighbor_indices, neighbor_distances = _query_neighbors(
+            index, knn_data.iloc[[target_position]].values, np.array([target_position]),
+            n_neighbors, query_mode, radius
+        )
+        log(f"Step 6-7: Neighbor indices ({query_mode} query, excluding target): {neighbor_indices}")
 
     # Map indices back to county names
     neighbor_counties = knn_data.iloc[neighbor_indices].index.tolist()
     log(f"Step 8: Neighbor counties identified: {neighbor_counties}")
 
-    # Extract neighbors' avg_cost_per_marker and county names from original data
-    neighbors_data = data[data[county_column].isin(neighbor_counties)][[county_column, cost_column]]
+    # Extract neighbors' avg_cost_per_marker from original data, keeping the nearest-first order
+    neighbors_data = pd.DataFrame({
+        county_column: neighbor_counties,
+        "Distance": neighbor_distances,
+        "Weight": _inverse_distance_weights(neighbor_distances),
+    }).merge(data[[county_column, cost_column]], on=county_column, how="left")
+    neighbors_data = neighbors_data[[county_column, cost_column, "Distance", "Weight"]]
     log("Step 9: Neighbors' data extracted with cost values.")
     log(f"Step 9b: Neighbor counties in knn_data: {neighbor_counties}")
     log(f"Step 9c: Neighbor counties in data: {data[county_column].unique()}")
@@ -107,13 +233,199 @@ def find_target_neighbors(data, data_std,
     log(f"Step 9d: Filtered neighbors_data:\n{neighbors_data}")
 
     # Add target county’s data to the neighbors data
-    target_data = data[data[county_column] == target_county][[county_column, cost_column]]
+    target_data = data[data[county_column] == target_county][[county_column, cost_column]].assign(Distance=0.0, Weight=np.nan)
     neighbors_data = pd.concat([target_data, neighbors_data], ignore_index=True)
     print(neighbors_data)
+    if len(neighbor_counties):
+        weighted_cost = (neighbors_data[cost_column] * neighbors_data["Weight"]).sum()
+        print(f"Distance-weighted neighbor cost for {target_county}: {weighted_cost:.2f} ({len(neighbor_counties)} neighbors)")
+    else:
+        print(f"No neighbors found for {target_county} within radius {radius}.")
     log("Step 10: Target county data added to neighbors data.")
 
     return neighbors_data
 
 
+def _neighbor_frame(counties, costs, query_positions, sources, neighbors, distances, county_column, cost_column, key_column):
+    """
+    Assembles the tidy output of a batched neighbor query: for each query, its own row (distance 0, no weight)
+    followed by its neighbors in order, with `key_column` naming the queried county.
+
+    Parameters:
+    - counties, costs (np.ndarray): County name and cost of each indexed row.
+    - query_positions (np.ndarray): Indexed row of each query.
+    - sources, neighbors, distances (np.ndarray): Flat query results from _query_neighbors.
+    """
+    n_queries = len(query_positions)
+    weights = _inverse_distance_weights(distances, sources)
+    rank = np.concatenate([np.full(n_queries, -1), np.arange(len(sources))])
+    sources = np.concatenate([np.arange(n_queries), sources])
+    order = np.lexsort((rank, sources))
+    rows = np.concatenate([query_positions, neighbors])[order]
+    return pd.DataFrame({
+        county_column: counties[rows],
+        cost_column: costs[rows],
+        "Distance": np.concatenate([np.zeros(n_queries), distances])[order],
+        "Weight": np.concatenate([np.full(n_queries, np.nan), weights])[order],
+        key_column: counties[query_positions][sources[order]],
+    })
+
+
+def _find_many_target_neighbors(data, data_for_knn, cost_column, county_column, targets, n_neighbors, metrics,
+                                verbose, backend, backend_params, spatial, spatial_options, query_mode, radius):
+    """Multi-target form of find_target_neighbors: one fitted index, one batched query, one tidy frame."""
+    knn_data = data_for_knn.set_index(county_column)[metrics]
+    missing = [target for target in targets if target not in knn_data.index]
+    if missing:
+        print(f"Error: Target counties not found in data_for_knn: {missing}")
+    targets = list(dict.fromkeys(target for target in targets if target in knn_data.index))
+    if not targets:
+        return None
+    _check_query_mode(query_mode, radius)
+
+    if spatial is not None:
+        # Spatial candidates differ per target, so each target gets its own (restricted) search
+        results = []
+        for target in targets:
+            target_neighbors = find_target_neighbors(
+                data, data_for_knn, cost_column, county_column, target, n_neighbors, metrics,
+                verbose, backend, backend_params, spatial, spatial_options, query_mode, radius
+            )
+            if target_neighbors is not None:
+                results.append(target_neighbors.assign(Target=target))
+        return pd.concat(results, ignore_index=True) if results else None
+
+    index = build_neighbor_index(knn_data.values, backend=backend, backend_params=backend_params)
+    positions = knn_data.index.get_indexer(targets)
+    sources, neighbors, distances = _query_neighbors(
+        index, knn_data.values[positions], positions, n_neighbors, query_mode, radius
+    )
+    if verbose:
+        print(f"'{backend}' neighbor index fitted once; {len(targets)} targets queried in one {query_mode} query.")
+
+    counties = knn_data.index.to_numpy()
+    costs = data.drop_duplicates(county_column).set_index(county_column)[cost_column].reindex(counties).to_numpy()
+    neighbors_data = _neighbor_frame(
+        counties, costs, positions, sources, neighbors, distances, county_column, cost_column, "Target"
+    )
+    print(neighbors_data)
+
+    # Distance-weighted cost per target (the target rows have no weight)
+    weighted = (neighbors_data[cost_column] * neighbors_data["Weight"]).groupby(neighbors_data["Target"], sort=False).sum(min_count=1)
+    counts = neighbors_data["Weight"].notna().groupby(neighbors_data["Target"], sort=False).sum()
+    for target in targets:
+        if counts[target]:
+            print(f"Distance-weighted neighbor cost for {target}: {weighted[target]:.2f} ({counts[target]} neighbors)")
+        else:
+            print(f"No neighbors found for {target} within radius {radius}.")
+    return neighbors_data
+
+
+def find_all_neighbors(data_std,
+    cost_column="avg_cost_per_marker",
+    county_column="County",
+    n_neighbors=5,
+    metrics=["wetlandd", "pop_d", "roadoverarea"],
+    query_mode="k",
+    radius=None,
+    backend="exact",
+    backend_params=None):
+    """
+    Finds the neighbors of every county with one index and one batched query. Same query modes and
+    output rows as find_target_neighbors, for all counties at once.
+
+    Returns:
+    - pd.DataFrame: For each source county, a row for the county itself followed by its neighbors from
+      nearest to farthest, with columns County, <cost column>, Distance, Weight and SourceCounty.
+    """
+    _check_query_mode(query_mode, radius)
+    features = data_std[metrics].values
+    n_counties = len(features)
+    index = build_neighbor_index(features, backend=backend, backend_params=backend_params)
+    sources, neighbors, distances = _query_neighbors(index, features, np.arange(n_counties), n_neighbors, query_mode, radius)
+
+    print(f"Found {len(neighbors)} neighbors for {n_counties} counties in one batched {query_mode} query.")
+    return _neighbor_frame(
+        data_std[county_column].values, data_std[cost_column].values, np.arange(n_counties),
+        sources, neighbors, distances, county_column, cost_column, "SourceCounty"
+    )
+
+
+def query_all_neighbors(features, n_neighbors=5, backend="exact", backend_params=None):
+    """
+    Finds the nearest neighbors of every row in one batched query, excluding each row from its own result.
+
+    Parameters:
+    - features (np.ndarray): Feature matrix (rows are counties).
+    - n_neighbors (int): Number of neighbors to return per row.
+    - backend (str): Neighbor search backend ("exact" or "ivf").
+    - backend_params (dict): Parameters for the selected backend.
+
+    Returns:
+    - tuple: (distances, indices), each of shape (n_rows, n_neighbors). Missing hits from approximate
+      backends are marked with index -1.
+    """
+    n_samples = features.shape[0]
+    index = build_neighbor_index(features, backend=backend, backend_params=backend_params)
+    return _without_self(*index.kneighbors(features, n_neighbors + 1), np.arange(n_samples))
+
+
+def predict_costs_loo(data_std,
+    cost_column="avg_cost_per_marker",
+    county_column="County",
+    metrics=["wetlandd", "pop_d", "roadoverarea"],
+    k_values=[3, 5, 10],
+    backend="exact",
+    backend_params=None):
+    """
+    Predicts every county's cost from its nearest neighbors with leave-one-out, using a single
+    (max(k) + 1)-neighbor query for all counties.
+
+    Parameters:
+    - data_std (pd.DataFrame): Standardized data with the metrics, county names and cost column.
+    - cost_column (str): Column representing the cost per marker.
+    - county_column (str): Column representing the county names.
+    - metrics (list): Metric columns used to find neighbors.
+    - k_values (list): Neighbor counts to evaluate.
+    - backend (str): Neighbor search backend ("exact" or "ivf").
+    - backend_params (dict): Parameters for the selected backend.
+
+    Returns:
+    - tuple: (predictions, scores) where predictions has one row per county with the actual cost
+      and a `<method>_k<k>` column per method and k, and scores has MAE/RMSE per k and method.
+    """
+    actual = data_std[cost_column].values.astype(float)
+    k_max = min(max(k_values), len(data_std) - 1)
+    distances, indices = query_all_neighbors(data_std[metrics].values, k_max, backend=backend, backend_params=backend_params)
+
+    # Approximate backends may return fewer than k hits, marked with index -1
+    missing = indices < 0
+    neighbor_costs = np.where(missing, np.nan, actual[np.where(missing, 0, indices)])
+    # Neighbors without a cost carry no weight, so the weighted mean is taken over the finite costs only
+    weights = np.where(np.isfinite(neighbor_costs), 1.0 / np.maximum(distances, 1e-12), 0.0)
 
+    predictions = pd.DataFrame({county_column: data_std[county_column].values, cost_column: actual})
+    scores = []
+    for k in sorted(set(min(k, k_max) for k in k_values)):
+        costs_k = neighbor_costs[:, :k]
+        weights_k = weights[:, :k]
+        total_weight = weights_k.sum(axis=1)
+        estimates = {
+            "mean": np.nanmean(costs_k, axis=1),
+            "median": np.nanmedian(costs_k, axis=1),
+            "weighted": np.nansum(costs_k * weights_k, axis=1) / np.where(total_weight > 0, total_weight, np.nan),
+        }
+        for method, estimate in estimates.items():
+            predictions[f"{method}_k{k}"] = estimate
+            errors = estimate - actual
+            scores.append({
+                "k": k,
+                "method": method,
+                "MAE": np.nanmean(np.abs(errors)),
+                "RMSE": np.sqrt(np.nanmean(errors ** 2)),
+            })
 
+    scores = pd.DataFrame(scores)
+    print("Leave-one-out KNN cost prediction:")
+    print(scores.to_string(index=False))
+    return predictions, scores
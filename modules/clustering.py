@@ -1,9 +1,15 @@
 # modules/clustering.py
+import os
+from datetime import datetime, timezone
 import matplotlib.pyplot as plt
-from sklearn.cluster import KMeans
+from scipy.optimize import linear_sum_assignment
+from sklearn.cluster import KMeans, Birch
 import numpy as np
 import time
 
+# Layout version of the saved cluster model files
+CLUSTER_MODEL_FORMAT = 1
+
 def find_optimal_clusters(data, max_clusters=10):
     inertias = []
     for k in range(1, max_clusters + 1):
@@ -31,23 +37,204 @@ def find_optimal_clusters(data, max_clusters=10):
             print("Invalid input. Please enter an integer.")
     return n_clusters
 
-def perform_clustering(data, n_clusters):
+def perform_clustering(data, n_clusters, random_state=42, verbose=True):
     """
     Performs KMeans clustering on the data with the specified number of clusters.
 
     Parameters:
     - data (pd.DataFrame): The standardized data.
     - n_clusters (int): The number of clusters to create.
+    - random_state (int): Seed for the centroid initialization.
+    - verbose (bool): If False, suppresses the progress messages (e.g. for repeated runs).
 
     Returns:
     - pd.Series: Cluster labels for each data point.
     """
-    print(f"Running KMeans clustering with {n_clusters} clusters...")
-    kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
+    if verbose:
+        print(f"Running KMeans clustering with {n_clusters} clusters...")
+    kmeans = KMeans(n_clusters=n_clusters, random_state=random_state, n_init=10)
     try:
         cluster_labels = kmeans.fit_predict(data)
-        print(f"Clustering completed with {n_clusters} clusters.")
+        if verbose:
+            print(f"Clustering completed with {n_clusters} clusters.")
         return cluster_labels
     except Exception as e:
         print(f"An error occurred during clustering: {e}")
         return None
+
+
+def perform_incremental_clustering(data, n_clusters, chunk_size=1000, threshold=0.5, branching_factor=50, model=None):
+    """
+    Clusters the data with Birch, feeding the feature matrix in chunks through partial_fit so that
+    memory stays bounded by the chunk size and the size of the CF-tree.
+
+    Parameters:
+    - data (pd.DataFrame or np.ndarray): The standardized data.
+    - n_clusters (int): The number of final clusters.
+    - chunk_size (int): Number of rows passed to each partial_fit call.
+    - threshold (float): Maximum radius of a Birch subcluster; larger values give a smaller tree.
+    - branching_factor (int): Maximum number of subclusters per CF-tree node.
+    - model (Birch): An existing fitted model to fold the rows into instead of starting a new one.
+
+    Returns:
+    - tuple: (cluster_labels, model) where cluster_labels is an np.array with one label per row and
+      model is the fitted Birch model, which can be passed back in to fold in new rows.
+    """
+    values = np.asarray(data)
+    if model is None:
+        model = Birch(n_clusters=None, threshold=threshold, branching_factor=branching_factor)
+    else:
+        # Skip the global clustering step while streaming; it runs once at the end
+        model.set_params(n_clusters=None)
+
+    print(f"Running incremental Birch clustering over {len(values)} rows in chunks of {chunk_size}...")
+    try:
+        for start in range(0, len(values), chunk_size):
+            model.partial_fit(values[start:start + chunk_size])
+
+        # Group the CF-tree subclusters into the final clusters (no data pass needed)
+        model.set_params(n_clusters=n_clusters)
+        model.partial_fit()
+
+        cluster_labels = np.concatenate([
+            model.predict(values[start:start + chunk_size])
+            for start in range(0, len(values), chunk_size)
+        ])
+        print(f"Clustering completed with {n_clusters} clusters from {len(model.subcluster_centers_)} subclusters.")
+        return cluster_labels, model
+    except Exception as e:
+        print(f"An error occurred during clustering: {e}")
+        return None, model
+
+
+def fold_in_rows(model, new_data, chunk_size=1000):
+    """
+    Folds new rows (e.g. newly surveyed counties) into the existing clusters of a fitted Birch model
+    without refitting it.
+
+    Each new row gets the cluster of its nearest CF-tree subcluster (the model's subcluster_labels_).
+    Neither the tree nor the global clustering step is touched, so the rows labelled earlier keep
+    their cluster IDs.
+
+    Parameters:
+    - model (Birch): A model returned by perform_incremental_clustering.
+    - new_data (pd.DataFrame or np.ndarray): New rows, standardized the same way as the original data.
+    - chunk_size (int): Number of rows predicted at a time.
+
+    Returns:
+    - tuple: (cluster_labels, model) with the labels of the new rows and the unchanged model.
+    """
+    values = np.asarray(new_data)
+    cluster_labels = np.concatenate([
+        model.predict(values[start:start + chunk_size])
+        for start in range(0, len(values), chunk_size)
+    ] + [np.zeros(0, dtype=int)])
+    print(f"Folded {len(values)} new rows into the {len(np.unique(model.subcluster_labels_))} existing clusters.")
+    return cluster_labels, model
+
+
+def build_cluster_model(features, labels, center, scale, feature_names, standardization, cluster_method, projection=None):
+    """
+    Packages a fitted clustering as a model that can label new rows without refitting: the standardization
+    (center and scale of the raw features), the optional PCA projection, and one centroid per cluster.
+
+    Parameters:
+    - features (np.ndarray): The rows the clustering was fitted on, in clustering space (standardized, and projected if any).
+    - labels (np.ndarray): The fitted cluster label of each row.
+    - center, scale (np.ndarray): Standardization parameters of the raw features (modules/preprocess.scaling_parameters).
+    - feature_names (list): Raw feature columns, in order.
+    - standardization (str): Standardization method.
+    - cluster_method (str): Clustering algorithm that produced the labels.
+    - projection (dict): Optional projection from modules/preprocess.load_projection.
+
+    Returns:
+    - dict: The cluster model. Cluster IDs are the fitted labels until aligned with align_cluster_ids.
+    """
+    features = np.asarray(features, dtype=float)
+    n_clusters = int(labels.max()) + 1
+    counts = np.bincount(labels, minlength=n_clusters)
+    centroids = np.column_stack([
+        np.bincount(labels, weights=features[:, j], minlength=n_clusters) for j in range(features.shape[1])
+    ]) / np.maximum(counts, 1)[:, None]
+
+    return {
+        "format_version": np.asarray(CLUSTER_MODEL_FORMAT),
+        "model_version": np.asarray(1),
+        "fitted_at": np.asarray(datetime.now(timezone.utc).isoformat(timespec="seconds")),
+        "features": np.asarray(feature_names, dtype=str),
+        "standardization": np.asarray(standardization),
+        "cluster_method": np.asarray(cluster_method),
+        "center": np.asarray(center, dtype=float),
+        "scale": np.asarray(scale, dtype=float),
+        "projection_mean": np.asarray(projection["mean"] if projection else np.zeros(0)),
+        "projection_components": np.asarray(projection["components"] if projection else np.zeros((0, 0))),
+        "centroids": centroids,
+        "cluster_ids": np.arange(n_clusters),
+    }
+
+
+def _to_clustering_space(model, raw):
+    values = (np.asarray(raw, dtype=float) - model["center"]) / model["scale"]
+    if model["projection_components"].size:
+        values = (values - model["projection_mean"]) @ model["projection_components"].T
+    return values
+
+
+def _to_raw_space(model, values):
+    if model["projection_components"].size:
+        values = values @ model["projection_components"] + model["projection_mean"]
+    return values * model["scale"] + model["center"]
+
+
+def align_cluster_ids(model, previous):
+    """
+    Keeps cluster IDs stable across refits: each new centroid takes the ID of the previous model's centroid
+    it is matched to by a minimum-cost assignment (Hungarian algorithm) on centroid distances, compared in
+    the new model's space. Clusters without a match get new IDs after the previous model's largest ID.
+
+    Returns:
+    - dict: The model with its cluster IDs replaced and its model version set to the previous version + 1.
+    """
+    previous_centroids = _to_clustering_space(model, _to_raw_space(previous, previous["centroids"]))
+    cost = np.linalg.norm(model["centroids"][:, None, :] - previous_centroids[None, :, :], axis=2)
+    new_rows, previous_rows = linear_sum_assignment(cost)
+
+    cluster_ids = np.full(len(model["centroids"]), -1)
+    cluster_ids[new_rows] = previous["cluster_ids"][previous_rows]
+    unmatched = cluster_ids < 0
+    cluster_ids[unmatched] = previous["cluster_ids"].max() + 1 + np.arange(unmatched.sum())
+    return dict(model, cluster_ids=cluster_ids, model_version=np.asarray(int(previous["model_version"]) + 1))
+
+
+def assign_clusters(model, raw):
+    """
+    Labels rows against a saved cluster model in one vectorized distance computation: the raw features are
+    standardized (and projected) with the model's parameters and each row takes its nearest centroid's ID.
+
+    Parameters:
+    - model (dict): Cluster model from build_cluster_model or load_cluster_model.
+    - raw (pd.DataFrame or np.ndarray): Raw (unstandardized) values of the model's features, in order.
+
+    Returns:
+    - tuple: (cluster_labels, distances) with the stable cluster ID of each row and its distance to that centroid.
+    """
+    values = _to_clustering_space(model, raw)
+    centroids = model["centroids"]
+    squared = (values ** 2).sum(axis=1)[:, None] - 2 * values @ centroids.T + (centroids ** 2).sum(axis=1)[None, :]
+    nearest = squared.argmin(axis=1)
+    distances = np.sqrt(np.maximum(squared[np.arange(len(values)), nearest], 0))
+    return model["cluster_ids"][nearest], distances
+
+
+def save_cluster_model(model, path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    np.savez(path, **model)
+    print(f"Cluster model v{int(model['model_version'])} ({len(model['centroids'])} clusters) saved to {path}")
+
+
+def load_cluster_model(path):
+    with np.load(path, allow_pickle=False) as arrays:
+        model = {key: arrays[key] for key in arrays.files}
+    if int(model["format_version"]) != CLUSTER_MODEL_FORMAT:
+        raise ValueError(f"Cluster model {path} has format {int(model['format_version'])}, expected {CLUSTER_MODEL_FORMAT}.")
+    return model
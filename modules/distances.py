@@ -0,0 +1,174 @@
+# modules/distances.py
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from modules.parallel import resolve_n_jobs
+
+
+def object_array(arrays):
+    """1-D object array holding one array per query (the extra None stops NumPy from stacking equal-length arrays)."""
+    return np.array(arrays + [None], dtype=object)[:-1]
+
+
+def block_rows(bytes_per_row, memory_limit_mb=256, n_jobs=1):
+    """
+    Number of query rows per block so that the blocks processed at once (one per thread), each taking
+    `bytes_per_row` per query row for its distances and reduction temporaries, stay within the memory budget.
+    """
+    bytes_per_row = max(1, bytes_per_row) * resolve_n_jobs(n_jobs)
+    return max(1, int(memory_limit_mb * 1024 ** 2 // bytes_per_row))
+
+
+def _map_blocks(block_function, n_rows, rows_per_block, n_jobs):
+    """Runs block_function(start, stop) over consecutive row blocks in a thread pool, in order."""
+    starts = range(0, n_rows, rows_per_block)
+    n_jobs = resolve_n_jobs(n_jobs, len(starts))
+    if n_jobs == 1:
+        return [block_function(start, min(start + rows_per_block, n_rows)) for start in starts]
+    # NumPy releases the GIL inside the matrix products, so threads run blocks concurrently
+    with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+        return list(executor.map(lambda start: block_function(start, min(start + rows_per_block, n_rows)), starts))
+
+
+def _squared_block(queries, data, data_norms):
+    """Float32 squared Euclidean distances between a block of queries and all data rows."""
+    # In place on the product, so a block needs a single float32 buffer
+    distances = queries @ data.T
+    distances *= -2
+    distances += (queries * queries).sum(axis=1)[:, None]
+    distances += data_norms[None, :]
+    return np.maximum(distances, 0, out=distances)
+
+
+def blockwise_kneighbors(queries, data, n_neighbors, exclude=None, memory_limit_mb=256, n_jobs=-1):
+    """
+    Exact k nearest neighbors of each query among the data rows, without materializing the full distance matrix.
+
+    Query rows are processed in blocks sized to the memory budget. Each block's distances are computed in
+    float32 and immediately reduced to a shortlist of candidates, which is re-ranked with float64 distances,
+    so the result matches an exact float64 search.
+
+    Parameters:
+    - queries (np.ndarray): Query rows.
+    - data (np.ndarray): Data rows to search.
+    - n_neighbors (int): Number of neighbors per query.
+    - exclude (np.ndarray): Optional data row to leave out for each query (e.g. the query itself).
+    - memory_limit_mb (float): Approximate memory bound for the blocks processed at once, across all threads.
+    - n_jobs (int): Number of threads (-1 uses all cores).
+
+    Returns:
+    - tuple: (distances, indices), each of shape (n_queries, n_neighbors), nearest first.
+    """
+    queries64 = np.asarray(queries, dtype=np.float64)
+    data64 = np.asarray(data, dtype=np.float64)
+    queries32, data32 = queries64.astype(np.float32), data64.astype(np.float32)
+    data_norms = (data32 * data32).sum(axis=1)
+    n_data = data64.shape[0]
+    n_neighbors = min(n_neighbors, n_data - (exclude is not None))
+    n_candidates = min(n_data, 2 * n_neighbors + 8)
+
+    def reduce_block(start, stop):
+        distances = _squared_block(queries32[start:stop], data32, data_norms)
+        if exclude is not None:
+            distances[np.arange(stop - start), exclude[start:stop]] = np.inf
+        candidates = np.argpartition(distances, n_candidates - 1, axis=1)[:, :n_candidates]
+
+        # Exact float64 re-ranking of the shortlist
+        exact = ((queries64[start:stop, None, :] - data64[candidates]) ** 2).sum(axis=2)
+        if exclude is not None:
+            exact[candidates == exclude[start:stop, None]] = np.inf
+        order = np.argsort(exact, axis=1, kind="stable")[:, :n_neighbors]
+        return np.sqrt(np.take_along_axis(exact, order, axis=1)), np.take_along_axis(candidates, order, axis=1)
+
+    # Per query row: float32 distances and argpartition's int64 positions over all data rows, plus the
+    # float64 re-ranking temporaries over the shortlist (gathered rows, differences, squares)
+    bytes_per_row = n_data * (4 + 8) + n_candidates * (3 * data64.shape[1] * 8 + 16)
+    rows_per_block = block_rows(bytes_per_row, memory_limit_mb, n_jobs)
+    blocks = _map_blocks(reduce_block, queries64.shape[0], rows_per_block, n_jobs)
+    if not blocks:
+        return np.zeros((0, n_neighbors)), np.zeros((0, n_neighbors), dtype=int)
+    return np.vstack([block[0] for block in blocks]), np.vstack([block[1] for block in blocks])
+
+
+def blockwise_radius_neighbors(queries, data, radius, memory_limit_mb=256, n_jobs=-1):
+    """
+    All data rows within `radius` of each query, block by block. Candidates found with float32 distances
+    (with a small tolerance) are confirmed with float64 distances.
+
+    Returns:
+    - tuple: (distances, indices) as object arrays with one array per query, nearest first.
+    """
+    queries64 = np.asarray(queries, dtype=np.float64)
+    data64 = np.asarray(data, dtype=np.float64)
+    queries32, data32 = queries64.astype(np.float32), data64.astype(np.float32)
+    data_norms = (data32 * data32).sum(axis=1)
+    slack = (radius * (1 + 1e-3) + 1e-3) ** 2
+
+    def reduce_block(start, stop):
+        rows, columns = np.nonzero(_squared_block(queries32[start:stop], data32, data_norms) <= slack)
+        exact = np.sqrt(((queries64[start + rows] - data64[columns]) ** 2).sum(axis=1))
+        keep = exact <= radius
+        return rows[keep] + start, columns[keep], exact[keep]
+
+    # Float32 distances, the boolean mask and the matches' positions
+    rows_per_block = block_rows(data64.shape[0] * 12, memory_limit_mb, n_jobs)
+    blocks = _map_blocks(reduce_block, queries64.shape[0], rows_per_block, n_jobs)
+    rows = np.concatenate([block[0] for block in blocks] + [np.zeros(0, dtype=int)])
+    columns = np.concatenate([block[1] for block in blocks] + [np.zeros(0, dtype=int)])
+    distances = np.concatenate([block[2] for block in blocks] + [np.zeros(0)])
+
+    order = np.lexsort((distances, rows))
+    splits = np.cumsum(np.bincount(rows, minlength=queries64.shape[0]))[:-1]
+    return object_array(np.split(distances[order], splits)), object_array(np.split(columns[order], splits))
+
+
+def blockwise_cluster_distance_sums(data, labels, memory_limit_mb=256, n_jobs=-1):
+    """
+    Sum of the distances from each row to all rows of each cluster, reduced block by block
+    (a float32 distance block times the one-hot cluster membership).
+
+    Returns:
+    - np.ndarray: (n_rows x n_clusters) distance sums.
+    """
+    data32 = np.asarray(data, dtype=np.float32)
+    labels = np.asarray(labels)
+    n_rows = data32.shape[0]
+    membership = np.zeros((n_rows, labels.max() + 1), dtype=np.float32)
+    membership[np.arange(n_rows), labels] = 1
+    data_norms = (data32 * data32).sum(axis=1)
+
+    def reduce_block(start, stop):
+        distances = np.sqrt(_squared_block(data32[start:stop], data32, data_norms))
+        # Rounding leaves small non-zero self-distances; they are exactly zero
+        distances[np.arange(stop - start), np.arange(start, stop)] = 0
+        return (distances @ membership).astype(np.float64)
+
+    # Squared and square-rooted float32 distances, plus the float64 sums
+    rows_per_block = block_rows(n_rows * 8 + membership.shape[1] * 12, memory_limit_mb, n_jobs)
+    return np.vstack(_map_blocks(reduce_block, n_rows, rows_per_block, n_jobs))
+
+
+def blockwise_silhouette(data, labels, memory_limit_mb=256, n_jobs=-1):
+    """
+    Mean silhouette coefficient computed from blockwise per-cluster distance sums, so memory stays within
+    the budget at any number of rows. Rows in single-row clusters score 0, as in scikit-learn.
+
+    Returns:
+    - float: The mean silhouette score.
+    """
+    _, labels = np.unique(np.asarray(labels), return_inverse=True)
+    if labels.max() < 1:
+        raise ValueError("The silhouette score needs at least two clusters.")
+    sums = blockwise_cluster_distance_sums(data, labels, memory_limit_mb, n_jobs)
+    counts = np.bincount(labels)
+    rows = np.arange(len(labels))
+
+    own_size = counts[labels]
+    intra = sums[rows, labels] / np.maximum(own_size - 1, 1)
+    mean_to_clusters = sums / counts[None, :]
+    mean_to_clusters[rows, labels] = np.inf
+    nearest_other = mean_to_clusters.min(axis=1)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        scores = (nearest_other - intra) / np.maximum(intra, nearest_other)
+    scores = np.where(own_size > 1, np.nan_to_num(scores), 0.0)
+    return float(scores.mean())
@@ -1,7 +1,12 @@
 # modules/evaluation.py
-from sklearn.metrics import silhouette_score
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+from modules.clustering import perform_clustering
+from modules.distances import blockwise_silhouette
+from modules.parallel import resolve_n_jobs, init_worker, worker_array
 
-def evaluate_clusters(data, cluster_labels, metric="silhouette"):
+def evaluate_clusters(data, cluster_labels, metric="silhouette", memory_limit_mb=256, n_jobs=-1):
     """
     Evaluates clustering performance using the specified metric.
 
@@ -9,13 +14,15 @@ def evaluate_clusters(data, cluster_labels, metric="silhouette"):
     - data (pd.DataFrame): The standardized data used for clustering.
     - cluster_labels (pd.Series or np.array): Labels from the clustering step.
     - metric (str): The evaluation metric to use, default is "silhouette".
+    - memory_limit_mb (float): Memory bound for one block of pairwise distances (see modules/distances.py).
+    - n_jobs (int): Number of threads for the distance blocks (-1 uses all cores).
 
     Returns:
     - float: The evaluation score.
     """
     if metric == "silhouette":
         try:
-            score = silhouette_score(data, cluster_labels)
+            score = blockwise_silhouette(np.asarray(data), np.asarray(cluster_labels), memory_limit_mb, n_jobs)
             print(f"Silhouette Score: {score:.4f}")
             return score
         except Exception as e:
@@ -24,3 +31,138 @@ def evaluate_clusters(data, cluster_labels, metric="silhouette"):
     else:
         print(f"Error: Unknown metric '{metric}'")
         return None
+
+
+def _stability_chunk(n_clusters, seed, n_resamples, data=None):
+    """
+    Clusters n_resamples bootstrap resamples and returns their co-association counts: how often each pair
+    of rows landed in the same cluster, and how often both rows were drawn.
+    """
+    data = worker_array("data", data)
+    n_samples = data.shape[0]
+    rng = np.random.default_rng(seed)
+    together = np.zeros((n_samples, n_samples), dtype=np.float32)
+    drawn = np.zeros((n_samples, n_samples), dtype=np.float32)
+
+    for _ in range(n_resamples):
+        sample = rng.choice(n_samples, size=n_samples, replace=True)
+        labels = perform_clustering(data[sample], n_clusters, random_state=int(rng.integers(2 ** 31)), verbose=False)
+        rows, first = np.unique(sample, return_index=True)
+
+        # One-hot cluster membership of the drawn rows; H @ H.T marks pairs sharing a cluster
+        membership = np.zeros((n_samples, n_clusters), dtype=np.float32)
+        membership[rows, labels[first]] = 1
+        together += membership @ membership.T
+        is_drawn = np.zeros(n_samples, dtype=np.float32)
+        is_drawn[rows] = 1
+        drawn += np.outer(is_drawn, is_drawn)
+
+    return n_clusters, together, drawn
+
+
+def _coassociation_counts(data, k_values, n_resamples, chunk_size, n_jobs, seed_sequence):
+    """Runs the bootstrap chunks for every k (in parallel) and sums their co-association counts per k."""
+    n_samples = data.shape[0]
+
+    # Independent seeds for every (k, chunk) task
+    chunk_sizes = [min(chunk_size, n_resamples - start) for start in range(0, n_resamples, chunk_size)]
+    seeds = seed_sequence.spawn(len(k_values) * len(chunk_sizes))
+    tasks = [(k, seeds[i * len(chunk_sizes) + j], size) for i, k in enumerate(k_values) for j, size in enumerate(chunk_sizes)]
+
+    together = {k: np.zeros((n_samples, n_samples)) for k in k_values}
+    drawn = {k: np.zeros((n_samples, n_samples)) for k in k_values}
+    n_jobs = resolve_n_jobs(n_jobs, len(tasks))
+
+    # Accumulate each chunk's counts as soon as it finishes
+    if n_jobs == 1:
+        for k, seed, size in tasks:
+            _, chunk_together, chunk_drawn = _stability_chunk(k, seed, size, data)
+            together[k] += chunk_together
+            drawn[k] += chunk_drawn
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=init_worker, initargs=({"data": data},)) as executor:
+            futures = [executor.submit(_stability_chunk, k, seed, size) for k, seed, size in tasks]
+            for future in as_completed(futures):
+                k, chunk_together, chunk_drawn = future.result()
+                together[k] += chunk_together
+                drawn[k] += chunk_drawn
+    return together, drawn, n_jobs
+
+
+def _pac(matrix, drawn):
+    """Proportion of ambiguous clustering: share of drawn pairs with a co-association strictly between 0.1 and 0.9."""
+    pairs = matrix[~np.eye(len(matrix), dtype=bool) & (drawn > 0)]
+    return np.mean((pairs > 0.1) & (pairs < 0.9))
+
+
+def cluster_stability(data, k_values=range(2, 11), n_resamples=200, chunk_size=25, n_jobs=-1, random_state=42, labels=None,
+                      null_reference=True):
+    """
+    Measures how stable the KMeans clusters are for each k by re-running perform_clustering on
+    bootstrap resamples in parallel and accumulating a row x row co-association matrix.
+
+    The co-association of two rows is the fraction of resamples containing both in which they share
+    a cluster. A k is stable when its co-associations are close to 0 or 1; the stability score is
+    1 - PAC, where PAC is the proportion of pairs with a co-association strictly between 0.1 and 0.9.
+    A row's assignment confidence is its mean agreement max(A, 1 - A) with all other rows.
+
+    1 - PAC tends to grow with k on its own, so k is chosen relative to a null reference: the same
+    resampling on the data with each column permuted independently, which keeps the marginal distributions
+    but has no cluster structure. The relative stability is null PAC - PAC, and the best k maximizes it.
+    A warning is printed when the best k lies at the edge of k_values, since a larger range may do better.
+
+    Parameters:
+    - data (pd.DataFrame or np.ndarray): The standardized data used for clustering.
+    - k_values (iterable): Numbers of clusters to evaluate.
+    - n_resamples (int): Number of bootstrap resamples per k.
+    - chunk_size (int): Number of resamples per worker task.
+    - n_jobs (int): Number of worker processes (-1 uses all cores, 1 runs in-process).
+    - random_state (int): Seed for the resampling.
+    - labels (list): Optional row names (e.g. counties) for the confidence table.
+    - null_reference (bool): If False, skips the null reference (halving the cost) and picks k by 1 - PAC alone.
+
+    Returns:
+    - tuple: (scores, confidence, coassociation) where scores has the stability score per k (and the
+      null and relative stability with the null reference), confidence has one row per data row and one
+      column per k, and coassociation maps k to its matrix.
+    """
+    data = np.asarray(data, dtype=float)
+    n_samples = data.shape[0]
+    k_values = list(k_values)
+    data_seed, null_seed, permutation_seed = np.random.SeedSequence(random_state).spawn(3)
+
+    together, drawn, n_jobs = _coassociation_counts(data, k_values, n_resamples, chunk_size, n_jobs, data_seed)
+    print(f"Clustered {n_resamples} bootstrap resamples for k in {k_values} on {n_jobs} process(es).")
+    if null_reference:
+        rng = np.random.default_rng(permutation_seed)
+        null_data = np.column_stack([rng.permutation(column) for column in data.T])
+        null_together, null_drawn, _ = _coassociation_counts(null_data, k_values, n_resamples, chunk_size, n_jobs, null_seed)
+        print("Clustered the same resamples of the column-permuted null reference.")
+
+    off_diagonal = ~np.eye(n_samples, dtype=bool)
+    scores, confidence, coassociation = [], {}, {}
+    for k in k_values:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            matrix = together[k] / drawn[k]
+        coassociation[k] = matrix
+
+        pac = _pac(matrix, drawn[k])
+        agreement = np.where(off_diagonal, np.maximum(matrix, 1 - matrix), np.nan)
+        confidence[k] = np.nanmean(agreement, axis=1)
+        score = {"k": k, "stability": 1 - pac, "mean_confidence": np.nanmean(confidence[k])}
+        if null_reference:
+            with np.errstate(invalid="ignore", divide="ignore"):
+                null_pac = _pac(null_together[k] / null_drawn[k], null_drawn[k])
+            score.update({"null_stability": 1 - null_pac, "relative_stability": null_pac - pac})
+        scores.append(score)
+
+    scores = pd.DataFrame(scores)
+    confidence = pd.DataFrame(confidence, index=labels)
+    criterion = "relative_stability" if null_reference else "stability"
+    best_k = int(scores.loc[scores[criterion].idxmax(), "k"])
+    print(scores.to_string(index=False))
+    print(f"Most stable number of clusters (by {criterion}): k = {best_k}")
+    if len(k_values) > 1 and best_k in (min(k_values), max(k_values)):
+        print(f"Warning: k = {best_k} is at the edge of the evaluated range {min(k_values)}-{max(k_values)}; "
+              f"the range may not contain the best k.")
+    return scores, confidence, coassociation
@@ -0,0 +1,107 @@
+# modules/graph.py
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from scipy.sparse.csgraph import connected_components
+
+
+def neighbor_graph(all_neighbors, county_column="County", source_column="SourceCounty", distance_column="Distance"):
+    """
+    Turns an all-neighbors table (modules/analysis.find_all_neighbors, or county_neighbors.csv) into a
+    sparse directed kNN graph: entry (i, j) is set when county j is a neighbor of county i.
+
+    Parameters:
+    - all_neighbors (pd.DataFrame): One row per (source county, neighbor); each source's own row is ignored.
+    - county_column (str): Column holding the neighbor county.
+    - source_column (str): Column holding the source county.
+    - distance_column (str): Column holding the neighbor distance. If it is missing, edges get weight 1.
+
+    Returns:
+    - tuple: (graph, counties) where graph is an (n x n) CSR matrix of neighbor distances and counties
+      holds the county name of each row/column.
+    """
+    counties = pd.Index(pd.unique(all_neighbors[[source_column, county_column]].values.ravel()))
+    sources = counties.get_indexer(all_neighbors[source_column])
+    neighbors = counties.get_indexer(all_neighbors[county_column])
+    edges = sources != neighbors
+    if distance_column in all_neighbors.columns:
+        # Zero distances (duplicate feature rows) would vanish from the sparse structure
+        weights = np.maximum(all_neighbors[distance_column].to_numpy(dtype=float)[edges], 1e-12)
+    else:
+        weights = np.ones(edges.sum())
+
+    n_counties = len(counties)
+    graph = sp.csr_matrix((weights, (sources[edges], neighbors[edges])), shape=(n_counties, n_counties))
+    return graph, counties.to_numpy()
+
+
+def mutual_graph(graph):
+    """Symmetric boolean graph of mutual neighbors: i and j are linked when each lists the other."""
+    adjacency = graph.astype(bool)
+    return adjacency.multiply(adjacency.T).tocsr()
+
+
+def hubness(in_degree):
+    """Skewness of the reverse-kNN count distribution; large positive values mean a few counties are hubs."""
+    centered = in_degree - in_degree.mean()
+    spread = np.sqrt((centered ** 2).mean())
+    return float((centered ** 3).mean() / spread ** 3) if spread > 0 else 0.0
+
+
+def neighbor_graph_report(graph, counties, hub_threshold=2.0):
+    """
+    Computes the neighbor-graph analytics with sparse operations: out-degree, reverse-kNN counts (in-degree),
+    mutual-neighbor counts and pairs, and the connected components of the mutual-kNN graph.
+
+    Parameters:
+    - graph (scipy.sparse matrix): Directed kNN graph from neighbor_graph.
+    - counties (np.ndarray): County name of each row/column.
+    - hub_threshold (float): A county is flagged as a hub when its reverse-kNN count is more than this many
+      standard deviations above the mean.
+
+    Returns:
+    - tuple: (per_county, pairs, summary) where per_county has one row per county, pairs lists the mutual
+      neighbor pairs with their distance, and summary holds the hubness and component counts.
+    """
+    adjacency = graph.astype(bool).astype(np.int32)
+    out_degree = np.asarray(adjacency.sum(axis=1)).ravel()
+    in_degree = np.asarray(adjacency.sum(axis=0)).ravel()
+
+    mutual = mutual_graph(graph)
+    mutual_count = np.asarray(mutual.sum(axis=1)).ravel()
+    n_components, component = connected_components(mutual, directed=False)
+    component_size = np.bincount(component)[component]
+
+    in_degree_std = in_degree.std()
+    hub_score = (in_degree - in_degree.mean()) / in_degree_std if in_degree_std > 0 else np.zeros(len(in_degree))
+    per_county = pd.DataFrame({
+        "County": counties,
+        "out_degree": out_degree,
+        "reverse_knn_count": in_degree,
+        "mutual_neighbors": mutual_count,
+        "hub_score": hub_score,
+        "is_hub": hub_score > hub_threshold,
+        "anti_hub": in_degree == 0,
+        "component": component,
+        "component_size": component_size,
+    })
+
+    upper = sp.triu(mutual, k=1).tocoo()
+    pairs = pd.DataFrame({
+        "County A": counties[upper.row],
+        "County B": counties[upper.col],
+        "Distance": np.asarray(graph[upper.row, upper.col]).ravel(),
+    })
+
+    summary = {
+        "counties": len(counties),
+        "edges": int(adjacency.nnz),
+        "mutual_pairs": len(pairs),
+        "hubness": hubness(in_degree),
+        "hubs": int(per_county["is_hub"].sum()),
+        "anti_hubs": int(per_county["anti_hub"].sum()),
+        "mutual_components": int(n_components),
+        "isolated_counties": int((mutual_count == 0).sum()),
+    }
+    print(f"Neighbor graph: {summary}")
+    return per_county, pairs, summary
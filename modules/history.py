@@ -0,0 +1,185 @@
+# modules/history.py
+import hashlib
+import json
+import os
+import re
+from datetime import datetime, timezone
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+    PARTITION_FORMAT = "parquet"
+except ImportError:
+    PARTITION_FORMAT = "pickle"
+
+# Cycle-specific column names mapped to their normalized names (after the generic normalization below)
+COLUMN_ALIASES = {
+    "County Without Asterisks and Trimmed": "County",
+}
+
+
+def normalize_column(column):
+    """
+    Normalizes a survey column name across cycles: drops the report prefix and grant-cycle suffix,
+    turns underscores into spaces and fixes the "Aveverage" typo of the 2021 report.
+
+    Example: "StateProgressReport2021_Remon_Corners_Completed_thru_2018_Grant_Cycle" and
+    "Remon Corners Completed thru 2022 Grant Cycle" both become "Remon Corners Completed".
+    """
+    name = re.sub(r"^StateProgressReport\d{4}_", "", column.strip())
+    name = name.replace("_", " ")
+    name = re.sub(r"\s+thru \d{4} Grant cycle$", "", name, flags=re.IGNORECASE)
+    name = name.replace("Aveverage", "Average")
+    return COLUMN_ALIASES.get(name, name)
+
+
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _manifest_path(store_path):
+    return os.path.join(store_path, "manifest.json")
+
+
+def read_manifest(store_path="data/history"):
+    """
+    Returns the store's manifest: one entry per ingested cycle with its source file, hash, size and
+    modification time, row count and partition.
+    """
+    if not os.path.exists(_manifest_path(store_path)):
+        return {}
+    with open(_manifest_path(store_path), "r") as f:
+        return json.load(f)
+
+
+def _write_manifest(manifest, store_path):
+    with open(_manifest_path(store_path), "w") as f:
+        json.dump(manifest, f, indent=4)
+
+
+def list_cycles(store_path="data/history"):
+    return sorted(int(year) for year in read_manifest(store_path))
+
+
+def ingest_cycle(source_path, year, store_path="data/history"):
+    """
+    Ingests one survey cycle into its own partition of the history store, with normalized column names.
+
+    The store is append-only: a cycle is parsed once. Re-ingesting the same source file is a no-op, and
+    ingesting a different file for a cycle that is already stored raises an error. A stored cycle whose
+    source still has the recorded size and modification time is not re-hashed.
+
+    Parameters:
+    - source_path (str): The cycle's survey CSV (e.g. data/raw/Data.csv for 2021).
+    - year (int): The survey cycle, used as the partition key.
+    - store_path (str): Root directory of the history store.
+
+    Returns:
+    - dict: The manifest entry of the cycle.
+    """
+    manifest = read_manifest(store_path)
+    stat = os.stat(source_path)
+    entry = manifest.get(str(year))
+    if entry is not None and (entry["source"], entry.get("size"), entry.get("mtime_ns")) == (
+            source_path, stat.st_size, stat.st_mtime_ns):
+        return entry
+
+    source_hash = _file_hash(source_path)
+    if entry is not None:
+        if entry["sha256"] == source_hash:
+            # Same content (touched, copied or from an older manifest): record the file's current stat
+            entry.update(source=source_path, size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+            _write_manifest(manifest, store_path)
+            return entry
+        raise ValueError(
+            f"Cycle {year} is already stored from {entry['source']}; the history store is append-only. "
+            f"Remove {entry['partition']} and its manifest entry to re-ingest it."
+        )
+
+    data = pd.read_csv(source_path, encoding="utf-8-sig")
+    data.columns = [normalize_column(column) for column in data.columns]
+    if "County" not in data.columns or "Average Spent per Corner Completed" not in data.columns:
+        raise ValueError(f"{source_path} has no County or Average Spent per Corner Completed column after normalization.")
+    if data["County"].duplicated().any():
+        raise ValueError(f"Duplicate entries found in 'County' column of {source_path}.")
+
+    # Yes/No flags as categoricals; everything else keeps its parsed type
+    for column in data.columns:
+        if data[column].dtype == object or pd.api.types.is_string_dtype(data[column]):
+            if column != "County" and data[column].nunique() <= 2:
+                data[column] = data[column].astype("category")
+    data.insert(0, "cycle", year)
+
+    partition_dir = os.path.join(store_path, f"cycle={year}")
+    os.makedirs(partition_dir, exist_ok=True)
+    if PARTITION_FORMAT == "parquet":
+        partition = os.path.join(partition_dir, "survey.parquet")
+        data.to_parquet(partition, index=False)
+    else:
+        partition = os.path.join(partition_dir, "survey.pkl")
+        data.to_pickle(partition)
+
+    entry = {
+        "source": source_path,
+        "sha256": source_hash,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "rows": len(data),
+        "columns": data.columns.tolist(),
+        "partition": partition,
+        "ingested_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+    manifest[str(year)] = entry
+    _write_manifest(manifest, store_path)
+    print(f"Ingested cycle {year} from {source_path} ({len(data)} rows) into {partition}")
+    return entry
+
+
+def load_cycle(year, columns=None, store_path="data/history"):
+    """
+    Loads one cycle from the history store without touching the other cycles.
+
+    Parameters:
+    - year (int): The survey cycle.
+    - columns (list): Optional normalized column names to read ("County" is always included).
+    - store_path (str): Root directory of the history store.
+
+    Returns:
+    - pd.DataFrame: The cycle's survey rows.
+    """
+    entry = read_manifest(store_path).get(str(year))
+    if entry is None:
+        raise KeyError(f"Cycle {year} is not in the history store. Stored cycles: {list_cycles(store_path)}")
+
+    if columns is not None:
+        columns = ["County"] + [column for column in columns if column != "County"]
+    if entry["partition"].endswith(".parquet"):
+        return pd.read_parquet(entry["partition"], columns=columns)
+    data = pd.read_pickle(entry["partition"])
+    return data if columns is None else data[columns]
+
+
+def cycle_deltas(from_year, to_year, column="Average Spent per Corner Completed", store_path="data/history"):
+    """
+    Computes the cycle-over-cycle change of a column for every county present in both cycles.
+
+    Parameters:
+    - from_year (int): The earlier cycle.
+    - to_year (int): The later cycle.
+    - column (str): Normalized column to compare.
+    - store_path (str): Root directory of the history store.
+
+    Returns:
+    - pd.DataFrame: County, the value in each cycle, the absolute delta and the percent change.
+    """
+    before = load_cycle(from_year, [column], store_path).rename(columns={column: f"{column} {from_year}"})
+    after = load_cycle(to_year, [column], store_path).rename(columns={column: f"{column} {to_year}"})
+    deltas = pd.merge(before, after, on="County", how="inner", validate="one_to_one")
+    deltas["delta"] = deltas[f"{column} {to_year}"] - deltas[f"{column} {from_year}"]
+    deltas["percent_change"] = deltas["delta"] / deltas[f"{column} {from_year}"] * 100
+    print(f"Computed {column} deltas from {from_year} to {to_year} for {len(deltas)} counties.")
+    return deltas
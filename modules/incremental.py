@@ -0,0 +1,177 @@
+# modules/incremental.py
+import os
+import numpy as np
+import pandas as pd
+from modules.analysis import query_all_neighbors
+from modules.preprocess import scaling_parameters
+from modules.distances import blockwise_kneighbors
+
+
+def _nearest_rows(features, rows, n_neighbors):
+    """Exact neighbors of the given rows against all rows (self excluded), by memory-bounded brute force."""
+    return blockwise_kneighbors(features[rows], features, n_neighbors, exclude=rows)
+
+
+def build_neighbor_state(data, metrics=["wetlandd", "pop_d", "roadoverarea"], n_neighbors=10, method="z-score",
+                         cost_column="avg_cost_per_marker", county_column="County"):
+    """
+    Computes the all-counties neighbor table from scratch and returns it as a state that
+    update_neighbor_state can maintain incrementally.
+
+    Parameters:
+    - data (pd.DataFrame): Raw (unstandardized) data with the metrics, county names and cost column.
+    - metrics (list): Metric columns used to find neighbors.
+    - n_neighbors (int): Number of neighbors per county.
+    - method (str): Standardization method ("z-score" or "minmax"); its parameters are frozen in the state.
+    - cost_column (str): Column representing the cost per marker.
+    - county_column (str): Column representing the county names.
+
+    Returns:
+    - dict: The neighbor state (county names, raw features, costs, frozen scaling, neighbor indices and distances).
+    """
+    raw = data[metrics].to_numpy(dtype=float)
+    center, scale = scaling_parameters(raw, method)
+    distances, indices = query_all_neighbors((raw - center) / scale, n_neighbors)
+    print(f"Built neighbor table for {len(raw)} counties from scratch.")
+    return {
+        "counties": np.asarray(data[county_column], dtype=str),
+        "raw": raw,
+        "costs": data[cost_column].to_numpy(dtype=float),
+        "center": center,
+        "scale": scale,
+        "indices": indices,
+        "distances": distances,
+        "metrics": np.asarray(metrics, dtype=str),
+        "method": np.asarray(method),
+        "n_neighbors": np.asarray(n_neighbors),
+        "cost_column": np.asarray(cost_column),
+        "county_column": np.asarray(county_column),
+    }
+
+
+def update_neighbor_state(state, data, drift_tolerance=0.01):
+    """
+    Brings a neighbor state up to date with new data, recomputing only the rows whose k-neighborhoods can change.
+
+    Rows are matched by county name. Inserted, deleted and feature-changed counties are diffed against the
+    state; the recomputed rows are the changed and inserted counties, their reverse neighbors (counties
+    that listed a deleted or moved county), and counties for which a moved or inserted county is now closer
+    than their current k-th neighbor. All other rows are carried over. Cost-only corrections never trigger
+    recomputation.
+
+    The standardization is frozen from the last full build. If the new data would shift the standardization
+    by more than `drift_tolerance` (relative to the frozen scale), the table is rebuilt from scratch instead.
+
+    Parameters:
+    - state (dict): State from build_neighbor_state, load_neighbor_state or a previous update.
+    - data (pd.DataFrame): The new raw data.
+    - drift_tolerance (float): Largest tolerated relative change of the standardization parameters.
+
+    Returns:
+    - tuple: (state, report) where report counts the inserted, deleted, updated and recomputed counties.
+    """
+    metrics = state["metrics"].tolist()
+    method = str(state["method"])
+    n_neighbors = int(state["n_neighbors"])
+    cost_column, county_column = str(state["cost_column"]), str(state["county_column"])
+
+    raw = data[metrics].to_numpy(dtype=float)
+    names = np.asarray(data[county_column], dtype=str)
+    center, scale = scaling_parameters(raw, method)
+    drift = max(np.max(np.abs(center - state["center"]) / state["scale"]), np.max(np.abs(scale / state["scale"] - 1)))
+    if drift > drift_tolerance or len(names) <= n_neighbors:
+        if len(names) <= n_neighbors:
+            print(f"Only {len(names)} counties for {n_neighbors} neighbors each; rebuilding the neighbor table.")
+        else:
+            print(f"Standardization drift {drift:.4f} exceeds {drift_tolerance}; rebuilding the neighbor table.")
+        new_state = build_neighbor_state(data, metrics, n_neighbors, method, cost_column, county_column)
+        return new_state, {"full_rebuild": True, "recomputed": len(names)}
+
+    # Diff the new rows against the state by county name
+    old_position = {name: i for i, name in enumerate(state["counties"])}
+    new_position = {name: i for i, name in enumerate(names)}
+    common = [name for name in names if name in old_position]
+    old_common = np.array([old_position[name] for name in common], dtype=int)
+    new_common = np.array([new_position[name] for name in common], dtype=int)
+    deleted = np.array([i for name, i in old_position.items() if name not in new_position], dtype=int)
+    inserted = np.array([i for name, i in new_position.items() if name not in old_position], dtype=int)
+
+    moved = ~np.all(np.isclose(state["raw"][old_common], raw[new_common]), axis=1)
+    old_to_new = np.full(len(state["counties"]), -1)
+    old_to_new[old_common] = new_common
+
+    features = (raw - state["center"]) / state["scale"]
+    affected = np.zeros(len(names), dtype=bool)
+
+    # Reverse neighbors: rows that listed a county which was deleted or moved
+    departed = np.zeros(len(state["counties"]), dtype=bool)
+    departed[deleted] = True
+    departed[old_common[moved]] = True
+    reverse = departed[state["indices"]].any(axis=1) & (old_to_new >= 0)
+    affected[old_to_new[reverse]] = True
+
+    # Arrivals (inserted or moved counties) are recomputed, and may enter other rows' neighborhoods
+    arrivals = np.concatenate([inserted, new_common[moved]]).astype(int)
+    affected[arrivals] = True
+    carried_new = np.flatnonzero(~affected)
+    carried_old = np.array([old_position[name] for name in names[carried_new]], dtype=int)
+    if len(arrivals) and len(carried_new):
+        arrival_dist = np.linalg.norm(features[carried_new][:, None, :] - features[arrivals][None, :, :], axis=2)
+        kth_distance = state["distances"][carried_old, -1]
+        gains = (arrival_dist < kth_distance[:, None]).any(axis=1)
+        affected[carried_new[gains]] = True
+        carried_new, carried_old = carried_new[~gains], carried_old[~gains]
+
+    indices = np.empty((len(names), n_neighbors), dtype=int)
+    distances = np.empty((len(names), n_neighbors))
+    indices[carried_new] = old_to_new[state["indices"][carried_old]]
+    distances[carried_new] = state["distances"][carried_old]
+
+    recompute = np.flatnonzero(affected)
+    if len(recompute):
+        distances[recompute], indices[recompute] = _nearest_rows(features, recompute, n_neighbors)
+
+    new_state = dict(state, counties=names, raw=raw, costs=data[cost_column].to_numpy(dtype=float),
+                     indices=indices, distances=distances)
+    report = {
+        "full_rebuild": False,
+        "inserted": len(inserted),
+        "deleted": len(deleted),
+        "updated": int(moved.sum()),
+        "recomputed": len(recompute),
+    }
+    print(f"Neighbor table updated incrementally: {report}")
+    return new_state, report
+
+
+def neighbor_table(state):
+    """
+    Expands a neighbor state into the all-neighbors table: for every source county, a row for the county
+    itself followed by its neighbors from nearest to farthest.
+
+    Returns:
+    - pd.DataFrame: Columns County, <cost column>, Distance, Weight (inverse distance, normalized over
+      the county's neighbors) and SourceCounty, as written by modules/analysis.find_all_neighbors.
+    """
+    n_counties, n_neighbors = state["indices"].shape
+    rows = np.column_stack([np.arange(n_counties), state["indices"]]).ravel()
+    distances = np.column_stack([np.zeros(n_counties), state["distances"]])
+    weights = 1.0 / np.maximum(state["distances"], 1e-12)
+    weights = np.column_stack([np.full(n_counties, np.nan), weights / weights.sum(axis=1, keepdims=True)])
+    return pd.DataFrame({
+        str(state["county_column"]): state["counties"][rows],
+        str(state["cost_column"]): state["costs"][rows],
+        "Distance": distances.ravel(),
+        "Weight": weights.ravel(),
+        "SourceCounty": np.repeat(state["counties"], n_neighbors + 1),
+    })
+
+
+def save_neighbor_state(state, path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    np.savez(path, **state)
+
+
+def load_neighbor_state(path):
+    with np.load(path, allow_pickle=False) as arrays:
+        return {key: arrays[key] for key in arrays.files}
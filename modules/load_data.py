@@ -1,30 +1,173 @@
 # modules/load_data.py
+import time
 import pandas as pd
 
-def load_csv(file_path):
+try:
+    import pyarrow  # noqa: F401
+    CSV_ENGINE = "pyarrow"
+except ImportError:
+    CSV_ENGINE = "c"
+
+
+class SchemaError(ValueError):
+    """Raised when a CSV file does not match its declared schema."""
+
+
+# Feature columns used downstream are parsed as float32; money columns keep float64 for cent precision.
+MONEY_COLUMNS = [
+    "Average Spent per Corner Completed",
+    "Median Spent per Corner Completed",
+    "P25 Spent per Corner Completed",
+    "P75 Spent per Corner Completed",
+    "P90 Spent per Corner Completed",
+    "Total Spent on Completed Corners",
+    "Total State Grants Awarded thru 2022 Grant Cycle",
+    "Total State Grants Expended thru 2022 Grant cycle",
+    "Total State Grants Awarded",
+    "Total State Grants Expended",
+]
+SCHEMAS = {
+    "survey": {
+        "dtypes": {
+            "County With Asterisks": str,
+            "County Without Asterisks and Trimmed": str,
+            "Maintenance?": "category",
+            "In Review?": "category",
+            "Total Remon Corners in County": "int32",
+            "Remon Corners Completed thru 2022 Grant Cycle": "int32",
+            "Percent Remon Corners Completed thru 2022 Grant Cycle": "float32",
+            "Average Spent per Corner Completed": "float64",
+            "Total State Grants Awarded thru 2022 Grant Cycle": "float64",
+            "Total State Grants Expended thru 2022 Grant cycle": "float64",
+        },
+        "required": ["County Without Asterisks and Trimmed", "Average Spent per Corner Completed"],
+    },
+    "population": {
+        "dtypes": {"NAME *": str, "pop_d": "float32"},
+        "required": ["NAME *", "pop_d"],
+    },
+    "road": {
+        "dtypes": {"NAME": str, "roadoverarea": "float32"},
+        "required": ["NAME", "roadoverarea"],
+    },
+    "wetlands": {
+        "dtypes": {"NAME": str, "wetlandd": "float32"},
+        "required": ["NAME", "wetlandd"],
+    },
+    "merged": {
+        "dtypes": {
+            "County With Asterisks": str,
+            "County": str,
+            "Maintenance?": "category",
+            "In Review?": "category",
+            "Total Remon Corners in County": "int32",
+            "Remon Corners Completed thru 2022 Grant Cycle": "int32",
+            "Percent Remon Corners Completed thru 2022 Grant Cycle": "float32",
+            "Average Spent per Corner Completed": "float64",
+            "Total State Grants Awarded thru 2022 Grant Cycle": "float64",
+            "Total State Grants Expended thru 2022 Grant cycle": "float64",
+            "pop_d": "float32",
+            "roadoverarea": "float32",
+            "wetlandd": "float32",
+            # Normalized names of survey cycles loaded from the history store (modules/history.py)
+            "cycle": "int16",
+            "Remon Corners Completed": "int32",
+            "Percent Remon Corners Completed": "float32",
+            "Total State Grants Awarded": "float64",
+            "Total State Grants Expended": "float64",
+            "TotalArea": "float32",
+            "TotalAreaRUCA7Plus": "float32",
+            "TotalAreaRUCA8Plus": "float32",
+            "TotalAreaRUCA9Plus": "float32",
+            "TotalAreaRUCA99": "float32",
+            "PercentRUCA7Plus": "float32",
+            "PercentRUCA8Plus": "float32",
+            "PercentRUCA9Plus": "float32",
+            "WeightedRuggednessScale": "float32",
+            "WeightedTRI": "float32",
+            "AverageTRI": "float32",
+            "RoadCount": "float32",
+            "RoadsPerSqMile": "float32",
+            "TotalPopulation": "float32",
+            "PopulationDensity": "float32",
+            "wetland area": "float32",
+            # County statistics aggregated from corner records (modules/aggregate.py)
+            "Total Spent on Completed Corners": "float64",
+            "Median Spent per Corner Completed": "float64",
+            "P25 Spent per Corner Completed": "float64",
+            "P75 Spent per Corner Completed": "float64",
+            "P90 Spent per Corner Completed": "float64",
+        },
+        "required": ["County", "Average Spent per Corner Completed", "pop_d", "roadoverarea", "wetlandd"],
+    },
+}
+
+
+def _read_header(file_path):
+    return pd.read_csv(file_path, nrows=0).columns.tolist()
+
+
+def _read_with_schema(file_path, schema):
+    """
+    Parses a CSV file according to a schema: validates required columns, projects the declared
+    columns only, and applies the declared dtypes.
+    """
+    if isinstance(schema, str):
+        if schema not in SCHEMAS:
+            raise SchemaError(f"Unknown schema '{schema}'. Options: {list(SCHEMAS)}")
+        schema = SCHEMAS[schema]
+
+    header = _read_header(file_path)
+    missing = [column for column in schema.get("required", []) if column not in header]
+    if missing:
+        raise SchemaError(f"Required columns missing from {file_path}: {missing}")
+
+    # Only parse the declared columns that the file actually has
+    dtypes = {column: dtype for column, dtype in schema["dtypes"].items() if column in header}
+    try:
+        return pd.read_csv(file_path, usecols=list(dtypes), dtype=dtypes, engine=CSV_ENGINE)
+    except (ValueError, TypeError) as e:
+        raise SchemaError(f"Column types in {file_path} do not match the declared schema - {e}") from e
+
+
+def load_csv(file_path, schema=None, log=print):
     """
     Reads a CSV file and returns a DataFrame.
-    
+
     Parameters:
     - file_path (str): Path to the CSV file.
+    - schema (str or dict): Name of a schema in SCHEMAS (or a schema dict) declaring the dtypes and
+      required columns. Only declared columns are parsed. If None, all columns are read with type inference.
+    - log (callable): Receives the load summary or error message. Worker threads pass a collector
+      (e.g. list.append) so the caller prints the messages from the main thread.
 
     Returns:
     - pd.DataFrame: Loaded data.
+
+    Raises:
+    - SchemaError: If required columns are missing or values do not match the declared dtypes.
     """
     try:
-        data = pd.read_csv(file_path)
-
+        start = time.perf_counter()
+        if schema is None:
+            data = pd.read_csv(file_path)
+        else:
+            data = _read_with_schema(file_path, schema)
 
-        print(f"Data loaded successfully from {file_path}")
+        memory_kb = data.memory_usage(deep=True).sum() / 1024
+        log(f"Data loaded successfully from {file_path} "
+            f"({len(data)} rows, {memory_kb:.1f} KB, {time.perf_counter() - start:.3f}s)")
         return data
     except FileNotFoundError:
-        print(f"Error: The file at {file_path} was not found.")
+        log(f"Error: The file at {file_path} was not found.")
         return None
     except pd.errors.EmptyDataError:
-        print("Error: The file is empty.")
+        log("Error: The file is empty.")
         return None
+    except SchemaError:
+        raise
     except KeyError as e:
-        print(f"Error: One or more specified columns not found in data - {e}")
+        raise SchemaError(f"One or more specified columns not found in {file_path} - {e}") from e
     except Exception as e:
-        print(f"An unexpected error occurred: {e}")
+        log(f"An unexpected error occurred: {e}")
         return None
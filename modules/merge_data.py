@@ -1,7 +1,86 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import pandas as pd
+from modules.load_data import load_csv
+from modules.history import normalize_column
+
+# Schema and county key column of each raw source
+SOURCE_KEYS = {
+    "state_survey": ("survey", "County Without Asterisks and Trimmed"),
+    "population": ("population", "NAME *"),
+    "road": ("road", "NAME"),
+    "wetlands": ("wetlands", "NAME"),
+}
+
+# Corner-count columns of the corner aggregates; counties without corner records get zero
+CORNER_COUNT_COLUMNS = ["Total Remon Corners in County", "Remon Corners Completed"]
+
+
+def _load_source(name, path):
+    """
+    Loads one raw source with its schema and returns it with load_csv's messages and its load time.
+    The messages are returned rather than printed so that concurrent loads do not interleave their output.
+    """
+    start = time.perf_counter()
+    messages = []
+    data = load_csv(path, schema=SOURCE_KEYS[name][0], log=messages.append)
+    return data, messages, time.perf_counter() - start
+
+
+def _validate_keys(name, data):
+    """Renames a source's key column to County and checks that every row has a unique county."""
+    data = data.rename(columns={SOURCE_KEYS[name][1]: "County"})
+    if data["County"].isnull().any():
+        raise ValueError(f"Missing values found in the county column of {name}.")
+    if data["County"].duplicated().any():
+        raise ValueError(f"Duplicate entries found in 'County' column of {name}.")
+    return data
+
+
+def load_sources(paths, sources=None, max_workers=4):
+    """
+    Reads and parses the raw sources concurrently. Each source's county keys are validated as soon as
+    it finishes, so a bad source fails the ingest without waiting for the others.
+
+    Parameters:
+        paths (dict): Path of each source, keyed by source name (see SOURCE_KEYS).
+        sources (dict): Optional pre-loaded frames that are used instead of reading their path.
+        max_workers (int): Maximum number of sources read at the same time.
+
+    Returns:
+        tuple: (sources, timings) where sources maps each name to its validated frame and timings
+            maps each read source to its load time in seconds.
+    """
+    sources = {name: _validate_keys(name, data) for name, data in (sources or {}).items() if data is not None}
+    pending = {name: path for name, path in paths.items() if name not in sources}
+    timings = {}
+
+    start = time.perf_counter()
+    # Parsing in pandas and pyarrow largely releases the GIL, so threads overlap I/O and parsing
+    executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(pending) or 1)))
+    try:
+        futures = {executor.submit(_load_source, name, path): name for name, path in pending.items()}
+        for future in as_completed(futures):
+            name = futures[future]
+            data, messages, timings[name] = future.result()
+            for message in messages:
+                print(message)
+            if data is None:
+                raise FileNotFoundError(f"Could not load {name} data from {pending[name]}.")
+            sources[name] = _validate_keys(name, data)
+    finally:
+        # On a failure, sources that have not started yet are not read
+        executor.shutdown(wait=True, cancel_futures=True)
+
+    if timings:
+        elapsed = time.perf_counter() - start
+        print("Source load times: " + ", ".join(f"{name} {seconds:.3f}s" for name, seconds in timings.items())
+              + f" (total {elapsed:.3f}s, {sum(timings.values()):.3f}s if read serially)")
+    return sources, timings
+
 
 def merge_county_data(
-    state_survey_path, population_path, road_path, wetlands_path
+    state_survey_path, population_path, road_path, wetlands_path, state_survey=None, corner_stats=None, max_workers=4
 ):
     """
     Merges data from four CSV files on the county name column.
@@ -11,21 +90,39 @@ def merge_county_data(
         population_path (str): Path to the population density data.
         road_path (str): Path to the road density data.
         wetlands_path (str): Path to the wetlands data.
+        state_survey (pd.DataFrame): Optional pre-loaded survey (e.g. a cycle from the history store)
+            used instead of reading state_survey_path.
+        corner_stats (pd.DataFrame): Optional county statistics aggregated from corner records
+            (modules/aggregate.py). They replace the survey's corner counts and costs for the survey's counties.
+        max_workers (int): Maximum number of sources read concurrently.
 
     Returns:
         pd.DataFrame: A merged DataFrame containing data from all four sources.
+
+    Raises:
+        SchemaError: If a source does not match its schema in modules/load_data.py.
     """
-    # Load the CSV files
-    state_survey = pd.read_csv(state_survey_path)
-    population = pd.read_csv(population_path)
-    road = pd.read_csv(road_path)
-    wetlands = pd.read_csv(wetlands_path)
-
-    # Ensure unique column names to avoid conflicts during merging
-    state_survey = state_survey.rename(columns={"County Without Asterisks and Trimmed": "County"})
-    population = population.rename(columns={"NAME *": "County", "pop_d": "pop_d"})
-    road = road.rename(columns={"NAME": "County", "roadoverarea": "roadoverarea"})
-    wetlands = wetlands.rename(columns={"NAME": "County", "wetlandd": "wetlandd"})
+    # Load the CSV files with their declared schemas, concurrently
+    sources, _ = load_sources(
+        {"state_survey": state_survey_path, "population": population_path, "road": road_path, "wetlands": wetlands_path},
+        sources={"state_survey": state_survey},
+        max_workers=max_workers
+    )
+    state_survey, population, road, wetlands = (sources[name] for name in SOURCE_KEYS)
+
+    # Corner-level aggregates take precedence over the survey's reported counts and costs
+    if corner_stats is not None:
+        replaced = [column for column in state_survey.columns
+                    if column != "County" and normalize_column(column) in corner_stats.columns]
+        state_survey = pd.merge(state_survey.drop(columns=replaced), corner_stats, on="County", how="left", validate="one_to_one")
+        # Survey counties without corner records have no corners: zero counts, no costs
+        counts = [column for column in CORNER_COUNT_COLUMNS if column in corner_stats.columns]
+        no_records = state_survey["County"][state_survey[counts].isna().all(axis=1)].tolist() if counts else []
+        for column in counts:
+            state_survey[column] = state_survey[column].fillna(0).astype("int32")
+        print(f"Replaced survey columns {replaced} with corner-level aggregates.")
+        if no_records:
+            print(f"Warning: {len(no_records)} survey counties have no corner records: {no_records}")
 
     # Log initial column information
     print("Columns in state_survey:", state_survey.columns.tolist())
@@ -33,10 +130,11 @@ def merge_county_data(
     print("Columns in road:", road.columns.tolist())
     print("Columns in wetlands:", wetlands.columns.tolist())
 
-    # Check for duplicates in the County column
-    for df, name in zip([state_survey, population, road, wetlands], ["state_survey", "population", "road", "wetlands"]):
-        if df["County"].duplicated().any():
-            raise ValueError(f"Duplicate entries found in 'County' column of {name}.")
+    # Survey counties without a match in a feature source end up with missing features
+    for name, df in [("population", population), ("road", road), ("wetlands", wetlands)]:
+        unmatched = sorted(set(state_survey["County"]) - set(df["County"]))
+        if unmatched:
+            print(f"Warning: {len(unmatched)} survey counties not found in {name}: {unmatched}")
 
     # Log the number of rows in each dataset
     print(f"Number of rows in state_survey: {len(state_survey)}")
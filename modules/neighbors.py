@@ -0,0 +1,263 @@
+# modules/neighbors.py
+import time
+import numpy as np
+import pandas as pd
+from sklearn.neighbors import NearestNeighbors
+from sklearn.cluster import MiniBatchKMeans
+from modules.distances import blockwise_kneighbors, blockwise_radius_neighbors, object_array
+
+
+class ExactNeighborIndex:
+    """
+    Exact nearest-neighbor index backed by scikit-learn's NearestNeighbors.
+
+    Parameters:
+    - algorithm (str): Tree or brute-force algorithm passed to NearestNeighbors ("auto", "kd_tree", "ball_tree", "brute").
+    - leaf_size (int): Leaf size for the tree-based algorithms.
+    """
+
+    def __init__(self, algorithm="auto", leaf_size=30):
+        self.algorithm = algorithm
+        self.leaf_size = leaf_size
+        self._nbrs = None
+
+    def fit(self, data):
+        self._nbrs = NearestNeighbors(algorithm=self.algorithm, leaf_size=self.leaf_size).fit(np.asarray(data))
+        return self
+
+    def kneighbors(self, queries, n_neighbors):
+        n_neighbors = min(n_neighbors, self._nbrs.n_samples_fit_)
+        return self._nbrs.kneighbors(np.asarray(queries), n_neighbors=n_neighbors)
+
+    def radius_neighbors(self, queries, radius):
+        return self._nbrs.radius_neighbors(np.asarray(queries), radius=radius, sort_results=True)
+
+
+class BlockwiseNeighborIndex:
+    """
+    Exact brute-force nearest-neighbor index that computes distances in float32 row blocks under a
+    memory budget and reduces each block to its top-k on the fly (see modules/distances.py), using a thread pool.
+
+    Parameters:
+    - memory_limit_mb (float): Approximate memory bound for one block of distances.
+    - n_jobs (int): Number of threads (-1 uses all cores).
+    """
+
+    def __init__(self, memory_limit_mb=256, n_jobs=-1):
+        self.memory_limit_mb = memory_limit_mb
+        self.n_jobs = n_jobs
+
+    def fit(self, data):
+        self.data_ = np.asarray(data, dtype=np.float64)
+        self.n_samples_fit_ = self.data_.shape[0]
+        return self
+
+    def kneighbors(self, queries, n_neighbors):
+        return blockwise_kneighbors(queries, self.data_, min(n_neighbors, self.n_samples_fit_),
+                                    memory_limit_mb=self.memory_limit_mb, n_jobs=self.n_jobs)
+
+    def radius_neighbors(self, queries, radius):
+        return blockwise_radius_neighbors(queries, self.data_, radius, memory_limit_mb=self.memory_limit_mb, n_jobs=self.n_jobs)
+
+
+class IVFNeighborIndex:
+    """
+    Approximate nearest-neighbor index using an inverted file (IVF) over k-means cells.
+
+    The data is partitioned into `n_lists` cells by a mini-batch k-means coarse quantizer.
+    A query only scans the points in its `n_probe` closest cells, so raising `n_probe`
+    trades speed for recall (n_probe == n_lists is an exact search).
+
+    Parameters:
+    - n_lists (int or None): Number of cells. Defaults to roughly sqrt(n_samples).
+    - n_probe (int): Number of cells scanned per query.
+    - batch_size (int): Mini-batch size for the coarse quantizer.
+    - query_batch_size (int): Number of queries processed together, bounding memory per step.
+    - random_state (int): Seed for the coarse quantizer.
+    """
+
+    def __init__(self, n_lists=None, n_probe=8, batch_size=4096, query_batch_size=4096, random_state=42):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.batch_size = batch_size
+        self.query_batch_size = query_batch_size
+        self.random_state = random_state
+
+    def fit(self, data):
+        data = np.ascontiguousarray(data, dtype=np.float32)
+        n_samples = data.shape[0]
+        n_lists = self.n_lists or max(1, int(np.sqrt(n_samples)))
+        n_lists = min(n_lists, n_samples)
+
+        quantizer = MiniBatchKMeans(
+            n_clusters=n_lists,
+            batch_size=self.batch_size,
+            random_state=self.random_state,
+            n_init=3
+        )
+        assignments = quantizer.fit_predict(data)
+
+        # Store the points grouped by cell so each cell is a contiguous slice
+        order = np.argsort(assignments, kind="stable")
+        self.centroids_ = quantizer.cluster_centers_.astype(np.float32)
+        self.data_ = data[order]
+        self.ids_ = order
+        self.offsets_ = np.concatenate(([0], np.cumsum(np.bincount(assignments, minlength=n_lists))))
+        self.n_lists_ = n_lists
+        self.n_samples_fit_ = n_samples
+        return self
+
+    def _query_batch(self, queries, n_neighbors, n_probe):
+        n_queries = queries.shape[0]
+        best_dist = np.full((n_queries, n_neighbors), np.inf, dtype=np.float32)
+        best_ids = np.full((n_queries, n_neighbors), -1, dtype=np.int64)
+
+        # Pick the n_probe closest cells for each query
+        centroid_dist = _squared_distances(queries, self.centroids_)
+        probes = np.argpartition(centroid_dist, n_probe - 1, axis=1)[:, :n_probe]
+
+        # Scan cell by cell, merging each cell's candidates into the running top-k
+        for cell in np.unique(probes):
+            start, end = self.offsets_[cell], self.offsets_[cell + 1]
+            if start == end:
+                continue
+            rows = np.flatnonzero((probes == cell).any(axis=1))
+            cell_dist = _squared_distances(queries[rows], self.data_[start:end])
+            cell_ids = np.broadcast_to(self.ids_[start:end], cell_dist.shape)
+
+            merged_dist = np.concatenate([best_dist[rows], cell_dist], axis=1)
+            merged_ids = np.concatenate([best_ids[rows], cell_ids], axis=1)
+            keep = np.argpartition(merged_dist, n_neighbors - 1, axis=1)[:, :n_neighbors]
+            best_dist[rows] = np.take_along_axis(merged_dist, keep, axis=1)
+            best_ids[rows] = np.take_along_axis(merged_ids, keep, axis=1)
+
+        order = np.argsort(best_dist, axis=1, kind="stable")
+        best_dist = np.take_along_axis(best_dist, order, axis=1)
+        best_ids = np.take_along_axis(best_ids, order, axis=1)
+        return np.sqrt(best_dist), best_ids
+
+    def kneighbors(self, queries, n_neighbors):
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        n_neighbors = min(n_neighbors, self.n_samples_fit_)
+        n_probe = max(1, min(self.n_probe, self.n_lists_))
+
+        distances, indices = [], []
+        for start in range(0, queries.shape[0], self.query_batch_size):
+            batch_dist, batch_ids = self._query_batch(queries[start:start + self.query_batch_size], n_neighbors, n_probe)
+            distances.append(batch_dist)
+            indices.append(batch_ids)
+        return np.vstack(distances), np.vstack(indices)
+
+    def radius_neighbors(self, queries, radius):
+        """All points within `radius` of each query, among the points of its n_probe closest cells."""
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        n_probe = max(1, min(self.n_probe, self.n_lists_))
+        centroid_dist = _squared_distances(queries, self.centroids_)
+        probes = np.argpartition(centroid_dist, n_probe - 1, axis=1)[:, :n_probe]
+
+        hit_rows, hit_ids, hit_dist = [], [], []
+        for cell in np.unique(probes):
+            start, end = self.offsets_[cell], self.offsets_[cell + 1]
+            if start == end:
+                continue
+            rows = np.flatnonzero((probes == cell).any(axis=1))
+            for batch in range(0, len(rows), self.query_batch_size):
+                batch_rows = rows[batch:batch + self.query_batch_size]
+                cell_dist = _squared_distances(queries[batch_rows], self.data_[start:end])
+                row, column = np.nonzero(cell_dist <= radius ** 2)
+                hit_rows.append(batch_rows[row])
+                hit_ids.append(self.ids_[start:end][column])
+                hit_dist.append(cell_dist[row, column])
+
+        # Group the hits by query, nearest first
+        hit_rows = np.concatenate(hit_rows) if hit_rows else np.zeros(0, dtype=int)
+        hit_ids = np.concatenate(hit_ids) if hit_ids else np.zeros(0, dtype=int)
+        hit_dist = np.sqrt(np.concatenate(hit_dist)) if hit_dist else np.zeros(0, dtype=np.float32)
+        order = np.lexsort((hit_dist, hit_rows))
+        splits = np.cumsum(np.bincount(hit_rows, minlength=queries.shape[0]))[:-1]
+        distances = np.split(hit_dist[order], splits)
+        indices = np.split(hit_ids[order], splits)
+        return object_array(distances), object_array(indices)
+
+
+def _squared_distances(a, b):
+    """Squared Euclidean distances between the rows of a and b, clipped at zero."""
+    dist = (a * a).sum(axis=1)[:, None] - 2 * (a @ b.T) + (b * b).sum(axis=1)[None, :]
+    return np.maximum(dist, 0)
+
+
+NEIGHBOR_BACKENDS = {
+    "exact": ExactNeighborIndex,
+    "blockwise": BlockwiseNeighborIndex,
+    "ivf": IVFNeighborIndex,
+}
+
+
+def build_neighbor_index(data, backend="exact", backend_params=None):
+    """
+    Builds and fits a nearest-neighbor index using the selected backend.
+
+    Parameters:
+    - data (pd.DataFrame or np.ndarray): Feature matrix to index.
+    - backend (str): Name of the backend ("exact", "blockwise" or "ivf").
+    - backend_params (dict): Keyword arguments passed to the backend constructor.
+
+    Returns:
+    - An index object exposing kneighbors(queries, n_neighbors) and radius_neighbors(queries, radius).
+    """
+    if backend not in NEIGHBOR_BACKENDS:
+        raise ValueError(f"Unknown neighbor backend '{backend}'. Options: {list(NEIGHBOR_BACKENDS)}")
+    return NEIGHBOR_BACKENDS[backend](**(backend_params or {})).fit(data)
+
+
+def neighbor_recall_report(data, n_neighbors=10, backend="ivf", param_grid=None, sample_size=1000, random_state=42):
+    """
+    Compares an approximate backend against the exact search on a sample of queries.
+
+    Parameters:
+    - data (pd.DataFrame or np.ndarray): Feature matrix to index.
+    - n_neighbors (int): Number of neighbors compared per query.
+    - backend (str): The approximate backend to evaluate.
+    - param_grid (list of dict): Backend parameter settings to evaluate, e.g. [{"n_probe": 1}, {"n_probe": 8}].
+    - sample_size (int): Number of rows used as queries.
+    - random_state (int): Seed for selecting the query sample.
+
+    Returns:
+    - pd.DataFrame: One row per parameter setting with recall@k, build time, query time and speedup over exact.
+    """
+    data = np.asarray(data)
+    rng = np.random.default_rng(random_state)
+    sample = rng.choice(data.shape[0], size=min(sample_size, data.shape[0]), replace=False)
+    queries = data[sample]
+
+    start = time.perf_counter()
+    exact = build_neighbor_index(data, backend="exact")
+    exact_build = time.perf_counter() - start
+    start = time.perf_counter()
+    _, exact_ids = exact.kneighbors(queries, n_neighbors)
+    exact_query = time.perf_counter() - start
+
+    rows = [{
+        "backend": "exact", "params": {}, "recall": 1.0,
+        "build_seconds": exact_build, "query_seconds": exact_query, "speedup": 1.0
+    }]
+    for params in param_grid or [{}]:
+        start = time.perf_counter()
+        index = build_neighbor_index(data, backend=backend, backend_params=params)
+        build_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        _, approx_ids = index.kneighbors(queries, n_neighbors)
+        query_seconds = time.perf_counter() - start
+
+        # recall@k: fraction of the exact neighbors found by the approximate search
+        hits = (approx_ids[:, :, None] == exact_ids[:, None, :]).any(axis=1).sum(axis=1)
+        rows.append({
+            "backend": backend, "params": params, "recall": float(hits.mean() / exact_ids.shape[1]),
+            "build_seconds": build_seconds, "query_seconds": query_seconds,
+            "speedup": exact_query / query_seconds if query_seconds > 0 else np.inf
+        })
+
+    report = pd.DataFrame(rows)
+    print(f"Recall report for {backend} backend ({len(sample)} queries, k={n_neighbors}):")
+    print(report.to_string(index=False))
+    return report
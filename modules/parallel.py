@@ -0,0 +1,21 @@
+# modules/parallel.py
+import os
+
+# Arrays shared with worker processes through the pool initializer, by name
+_worker_arrays = {}
+
+
+def resolve_n_jobs(n_jobs, n_tasks=None):
+    """Number of workers for n_jobs (-1 or None uses all cores), capped at n_tasks when given."""
+    n_jobs = os.cpu_count() if n_jobs in (None, -1) else n_jobs
+    return max(1, n_jobs if n_tasks is None else min(n_jobs, n_tasks))
+
+
+def init_worker(arrays):
+    """Pool initializer storing the arrays (a dict of name -> array) once per worker process."""
+    _worker_arrays.update(arrays)
+
+
+def worker_array(name, local=None):
+    """Returns `local` when the task runs in-process, else the array the pool initializer shared under `name`."""
+    return _worker_arrays[name] if local is None else local
@@ -1,6 +1,19 @@
 # modules/preprocess.py
+import os
+import sys
+import numpy as np
 import pandas as pd
+from sklearn.decomposition import PCA
 from sklearn.preprocessing import StandardScaler, MinMaxScaler
+from modules.load_data import MONEY_COLUMNS
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+# Spellings of yes/no flag columns (e.g. "Maintenance?") that are stored as booleans
+FLAG_VALUES = {"yes": True, "no": False, "y": True, "n": False, "true": True, "false": False}
 
 def standardize(df, method="z-score"):
     if method == "z-score":
@@ -18,6 +31,153 @@ def standardize(df, method="z-score"):
     return standardized_df
 
 
+def scaling_parameters(values, method="z-score"):
+    """
+    Center and scale that `standardize` applies for the given method (constant columns get scale 1),
+    so that standardization fitted on one dataset can be reapplied to new rows.
+
+    Returns:
+    - tuple: (center, scale) arrays with one entry per column.
+    """
+    values = np.asarray(values, dtype=float)
+    if method == "z-score":
+        center, scale = values.mean(axis=0), values.std(axis=0)
+    elif method == "minmax":
+        center, scale = values.min(axis=0), values.max(axis=0) - values.min(axis=0)
+    else:
+        raise ValueError(f"Unknown standardization method: {method}")
+    return center, np.where(scale == 0, 1.0, scale)
+
+
+def load_projection(cache_path, features, target_variance=0.95, n_components=None, standardization="z-score"):
+    """Returns the cached projection if it was fitted on the same features, standardization and settings, else None."""
+    if not cache_path or not os.path.exists(cache_path):
+        return None
+    with np.load(cache_path, allow_pickle=False) as arrays:
+        projection = {key: arrays[key] for key in arrays.files}
+    if projection["features"].tolist() != list(features):
+        print(f"Cached projection in {cache_path} was fitted on other features; refitting.")
+        return None
+    # n_components is stored as 0 when the component count follows target_variance
+    settings = (str(standardization), float(target_variance), int(n_components or 0))
+    cached = (str(projection.get("standardization", "")), float(projection.get("target_variance", np.nan)),
+              int(projection.get("n_components", -1)))
+    if cached != settings:
+        print(f"Cached projection in {cache_path} was fitted with other settings "
+              f"(standardization, target_variance, n_components) = {cached}; refitting.")
+        return None
+    return projection
+
+
+def project(df, target_variance=0.95, n_components=None, cache_path="data/processed/projection.npz", rebuild=False,
+            standardization="z-score"):
+    """
+    Projects standardized features onto their principal components.
+
+    The PCA is fitted once and cached with its components, so later runs (and new or corrected rows)
+    are projected onto the same axes. It is refitted when the cache is missing, was fitted on other
+    feature columns, standardization, target_variance or n_components, or `rebuild` is set.
+
+    Parameters:
+    - df (pd.DataFrame): Standardized feature columns.
+    - target_variance (float): Share of the variance the retained components must explain.
+    - n_components (int): Fixed number of components; overrides `target_variance`.
+    - cache_path (str): Path of the .npz cache (None disables caching).
+    - rebuild (bool): If True, ignores an existing cache.
+    - standardization (str): Standardization method of the input columns, recorded with the cache.
+
+    Returns:
+    - pd.DataFrame: The components PC1..PCn, with the same index as the input.
+    """
+    features = df.columns.tolist()
+    projection = None if rebuild else load_projection(cache_path, features, target_variance, n_components, standardization)
+    if projection is None:
+        pca = PCA(n_components=n_components or target_variance, svd_solver="full")
+        pca.fit(df.to_numpy(dtype=float))
+        projection = {
+            "features": np.asarray(features, dtype=str),
+            "mean": pca.mean_,
+            "components": pca.components_,
+            "explained_variance_ratio": pca.explained_variance_ratio_,
+            "target_variance": np.float64(target_variance),
+            "n_components": np.int64(n_components or 0),
+            "standardization": np.asarray(standardization, dtype=str),
+        }
+        if cache_path:
+            os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+            # Written through a temporary file so a concurrent run never reads a partial cache
+            temporary = f"{cache_path}.{os.getpid()}.tmp"
+            with open(temporary, "wb") as f:
+                np.savez(f, **projection)
+            os.replace(temporary, cache_path)
+            print(f"Projection fitted on {len(df)} rows and cached to {cache_path}")
+
+    components = (df.to_numpy(dtype=float) - projection["mean"]) @ projection["components"].T
+    columns = [f"PC{i + 1}" for i in range(components.shape[1])]
+    explained = projection["explained_variance_ratio"]
+    print(f"Projected {len(features)} features onto {len(columns)} components "
+          f"explaining {explained.sum():.1%} of the variance "
+          f"({', '.join(f'{column}: {ratio:.1%}' for column, ratio in zip(columns, explained))}).")
+    return pd.DataFrame(components.astype(np.float32), index=df.index, columns=columns)
+
+
+def compact_frame(df, keep_columns, float64_columns=MONEY_COLUMNS):
+    """
+    Shrinks a county frame to what the analyses use: drops every column not in `keep_columns`,
+    downcasts floats to float32 (except the money columns) and integers to the smallest integer type,
+    turns yes/no flags into booleans and other text columns (e.g. county names) into categoricals.
+
+    Parameters:
+    - df (pd.DataFrame): The merged (and filtered) data.
+    - keep_columns (list): Columns used downstream.
+    - float64_columns (list): Float columns kept in float64 for cent precision.
+
+    Returns:
+    - pd.DataFrame: The compacted frame.
+    """
+    before_kb = df.memory_usage(deep=True).sum() / 1024
+    keep = set(keep_columns)
+    compacted = df[[column for column in df.columns if column in keep]]
+
+    columns = {}
+    for column in compacted.columns:
+        values = compacted[column]
+        if pd.api.types.is_bool_dtype(values):
+            continue
+        if pd.api.types.is_float_dtype(values):
+            if column in float64_columns:
+                if values.dtype != np.float64:
+                    columns[column] = values.astype(np.float64)
+            elif values.dtype != np.float32:
+                columns[column] = values.astype(np.float32)
+        elif pd.api.types.is_integer_dtype(values):
+            columns[column] = pd.to_numeric(values, downcast="integer")
+        else:
+            text = values.astype(str).str.strip()
+            flags = text.str.lower().map(FLAG_VALUES)
+            if values.notna().all() and flags.notna().all():
+                columns[column] = flags.astype(bool)
+            else:
+                columns[column] = values.astype("category").cat.remove_unused_categories()
+    compacted = compacted.assign(**columns)
+
+    after_kb = compacted.memory_usage(deep=True).sum() / 1024
+    print(f"Compacted data from {before_kb:.1f} KB to {after_kb:.1f} KB "
+          f"({len(df.columns) - len(compacted.columns)} unused columns dropped).")
+    return compacted
+
+
+def memory_report(**frames):
+    """
+    Prints the memory held by each named frame and the peak resident memory of the process.
+    """
+    sizes = ", ".join(f"{name} {frame.memory_usage(deep=True).sum() / 1024:.1f} KB" for name, frame in frames.items())
+    if resource is not None:
+        # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 ** 2 if sys.platform == "darwin" else 1024)
+        sizes += f"; peak process memory {peak:.1f} MB"
+    print(f"Memory: {sizes}")
+
 
 def filter_data(data, config):
     """
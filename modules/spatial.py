@@ -0,0 +1,185 @@
+# modules/spatial.py
+import os
+import numpy as np
+import scipy.sparse as sp
+from scipy.spatial import cKDTree
+
+try:
+    import geopandas as gpd
+except ImportError:
+    gpd = None
+
+# NAD83 / Michigan Oblique Mercator: metric coordinates for the MGF county layer (see County.xml)
+MICHIGAN_CRS = "EPSG:3078"
+
+
+def _csr_to_arrays(prefix, matrix):
+    return {f"{prefix}_data": matrix.data, f"{prefix}_indices": matrix.indices, f"{prefix}_indptr": matrix.indptr}
+
+
+def _csr_from_arrays(prefix, arrays, shape):
+    return sp.csr_matrix((arrays[f"{prefix}_data"], arrays[f"{prefix}_indices"], arrays[f"{prefix}_indptr"]), shape=shape)
+
+
+def build_county_graph(shapefile_path="data/raw/County.shp", name_column="Name", cache_path="data/processed/county_graph.npz",
+                       max_distance_km=250, crs=MICHIGAN_CRS, rebuild=False):
+    """
+    Builds the county contiguity and centroid-distance graph from the MGF county boundary layer and
+    caches it as sparse matrices. The cache is reused until the shapefile is newer than it.
+
+    Contiguity is found with the layer's spatial index (polygons that touch or overlap, i.e. queen
+    contiguity); centroid distances are kept for county pairs within `max_distance_km`.
+
+    Parameters:
+    - shapefile_path (str): Path to the county boundary shapefile (requires geopandas).
+    - name_column (str): Attribute holding the county name (the MGF layer uses "Name").
+    - cache_path (str): Path of the .npz cache.
+    - max_distance_km (float): Largest centroid distance stored in the sparse distance matrix.
+    - crs (str): Projected CRS used for centroids and distances.
+    - rebuild (bool): If True, ignores an existing cache.
+
+    Returns:
+    - dict: {"counties": np.array of names, "contiguity": CSR bool matrix, "distance_km": CSR float
+      matrix, "centroids": (n x 2) array in meters, "max_distance_km": float}
+    """
+    cache_is_fresh = (
+        cache_path and os.path.exists(cache_path)
+        and (not os.path.exists(shapefile_path) or os.path.getmtime(cache_path) >= os.path.getmtime(shapefile_path))
+    )
+    if cache_is_fresh and not rebuild:
+        return load_county_graph(cache_path)
+
+    if gpd is None:
+        raise ImportError("geopandas is required to build the county graph from a shapefile.")
+
+    print(f"Building county adjacency graph from {shapefile_path}...")
+    counties = gpd.read_file(shapefile_path).to_crs(crs).sort_values(name_column).reset_index(drop=True)
+    names = np.asarray(counties[name_column].astype(str).str.strip(), dtype=str)
+    n_counties = len(counties)
+
+    # Contiguity: one bulk spatial-index query for all county pairs
+    left, right = counties.sindex.query(counties.geometry, predicate="intersects")
+    keep = left != right
+    contiguity = sp.csr_matrix((np.ones(keep.sum(), dtype=bool), (left[keep], right[keep])), shape=(n_counties, n_counties))
+
+    # Centroid distances within the cutoff, from a KD-tree over the centroids
+    centroid_points = counties.geometry.centroid
+    centroids = np.column_stack([centroid_points.x, centroid_points.y])
+    tree = cKDTree(centroids)
+    distance_km = tree.sparse_distance_matrix(tree, max_distance_km * 1000, output_type="coo_matrix").tocsr() / 1000
+    distance_km.eliminate_zeros()
+
+    graph = {
+        "counties": names,
+        "contiguity": contiguity,
+        "distance_km": distance_km.tocsr(),
+        "centroids": centroids,
+        "max_distance_km": float(max_distance_km),
+    }
+    if cache_path:
+        os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+        np.savez(
+            cache_path,
+            counties=names,
+            centroids=centroids,
+            max_distance_km=max_distance_km,
+            **_csr_to_arrays("contiguity", contiguity),
+            **_csr_to_arrays("distance", graph["distance_km"])
+        )
+        print(f"County graph with {contiguity.nnz // 2} contiguous pairs cached to {cache_path}")
+    return graph
+
+
+def load_county_graph(cache_path="data/processed/county_graph.npz"):
+    """
+    Loads a county graph cached by build_county_graph.
+
+    Returns:
+    - dict: The same structure as build_county_graph.
+    """
+    with np.load(cache_path, allow_pickle=False) as arrays:
+        names = arrays["counties"]
+        shape = (len(names), len(names))
+        graph = {
+            "counties": names,
+            "contiguity": _csr_from_arrays("contiguity", arrays, shape),
+            "distance_km": _csr_from_arrays("distance", arrays, shape),
+            "centroids": arrays["centroids"],
+            "max_distance_km": float(arrays["max_distance_km"]),
+        }
+    print(f"County graph loaded from {cache_path}")
+    return graph
+
+
+def missing_counties(graph, counties):
+    """Returns the counties (in order, without repeats) that are not nodes of the county graph."""
+    known = set(graph["counties"].tolist())
+    return [name for name in dict.fromkeys(counties) if name not in known]
+
+
+def _graph_positions(graph, counties):
+    missing = missing_counties(graph, counties)
+    if missing:
+        raise ValueError(f"Counties not found in the county graph: {missing}")
+    position = {name: i for i, name in enumerate(graph["counties"])}
+    return [position[name] for name in counties]
+
+
+def geographic_distances(graph, target_counties, counties):
+    """
+    Looks up the centroid distances (km) from each target county to a list of counties. The graph only
+    stores pairs within its cutoff, so pairs beyond it get inf.
+
+    Parameters:
+    - graph (dict): County graph from build_county_graph.
+    - target_counties (list): Counties the distances are measured from.
+    - counties (list): Counties the distances are measured to.
+
+    Returns:
+    - np.ndarray: (len(target_counties) x len(counties)) distances in km.
+
+    Raises:
+    - ValueError: If a county is not in the graph.
+    """
+    rows = _graph_positions(graph, list(target_counties))
+    columns = _graph_positions(graph, list(counties))
+    block = graph["distance_km"][rows][:, columns].toarray()
+
+    # Zero entries are either the county itself or pairs beyond the cutoff
+    same = np.asarray(rows)[:, None] == np.asarray(columns)[None, :]
+    return np.where((block == 0) & ~same, np.inf, block)
+
+
+def spatial_candidates(graph, target_county, counties, max_distance_km=None, max_hops=1):
+    """
+    Selects the counties that are geographically eligible as peers of the target county: within
+    `max_distance_km` (centroid distance) when given, otherwise within `max_hops` steps of contiguity.
+
+    Parameters:
+    - graph (dict): County graph from build_county_graph.
+    - target_county (str): The target county.
+    - counties (list): Counties to choose from (e.g. the rows of the KNN data).
+    - max_distance_km (float): Maximum centroid distance; at most the graph's cutoff distance.
+    - max_hops (int): Maximum number of contiguity steps (1 = counties sharing a border).
+
+    Returns:
+    - np.ndarray: Boolean mask over `counties`.
+
+    Raises:
+    - ValueError: If a county is not in the graph, or max_distance_km exceeds the graph's cutoff.
+    """
+    if max_distance_km is not None:
+        if max_distance_km > graph["max_distance_km"]:
+            raise ValueError(
+                f"max_distance_km ({max_distance_km}) exceeds the county graph's cutoff of "
+                f"{graph['max_distance_km']} km; rebuild the graph with a larger graph_max_distance_km."
+            )
+        return geographic_distances(graph, [target_county], counties)[0] <= max_distance_km
+
+    target_position = _graph_positions(graph, [target_county])[0]
+    positions = _graph_positions(graph, list(counties))
+    reached = np.zeros(len(graph["counties"]), dtype=bool)
+    reached[target_position] = True
+    for _ in range(max_hops):
+        reached |= graph["contiguity"].T.dot(reached.astype(np.int32)) > 0
+    return reached[positions]
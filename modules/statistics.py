@@ -0,0 +1,233 @@
+# modules/statistics.py
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from modules.analysis import query_all_neighbors
+from modules.parallel import resolve_n_jobs, init_worker, worker_array
+
+
+def _run_chunks(chunk_function, costs, seeds, chunk_sizes, n_jobs, **kwargs):
+    """Runs chunk_function(seed, size, costs=..., **kwargs) for every chunk, in-process or on a process pool."""
+    if n_jobs == 1:
+        return [chunk_function(seed, size, costs, **kwargs) for seed, size in zip(seeds, chunk_sizes)]
+
+    futures = []
+    with ProcessPoolExecutor(max_workers=n_jobs, initializer=init_worker, initargs=({"costs": costs},)) as executor:
+        for seed, size in zip(seeds, chunk_sizes):
+            futures.append(executor.submit(chunk_function, seed, size, **kwargs))
+        return [future.result() for future in futures]
+
+
+def _split_chunks(n_total, chunk_size, random_state, n_jobs=1):
+    """
+    Splits n_total draws into chunks of at most chunk_size, each with an independent seed. With several
+    workers the chunks are made small enough that every worker gets at least one.
+    """
+    if n_jobs > 1:
+        chunk_size = min(chunk_size, -(-n_total // n_jobs))
+    chunk_sizes = [min(chunk_size, n_total - start) for start in range(0, n_total, chunk_size)]
+    return np.random.SeedSequence(random_state).spawn(len(chunk_sizes)), chunk_sizes
+
+
+def _resamples_per_chunk(n_groups, group_size, memory_limit_mb):
+    """Number of bootstrap resamples whose (groups x resamples x k) arrays fit in the memory limit."""
+    # Index array (int64) plus the gathered costs and a sorted copy (float64)
+    bytes_per_resample = n_groups * group_size * 8 * 3
+    return max(1, int(memory_limit_mb * 1024 ** 2 // bytes_per_resample))
+
+
+def _bootstrap_chunk(seed, n_resamples, neighbor_costs=None):
+    """
+    Draws n_resamples bootstrap samples for every neighbor group at once and returns their medians and IQRs.
+    """
+    costs = worker_array("costs", neighbor_costs)
+    n_groups, group_size = costs.shape
+    rng = np.random.default_rng(seed)
+
+    # (groups x resamples x k) indices into each group's own neighbor costs
+    resample_idx = rng.integers(0, group_size, size=(n_groups, n_resamples, group_size))
+    samples = np.take_along_axis(costs[:, None, :], resample_idx, axis=2)
+    q25, q50, q75 = np.percentile(samples, [25, 50, 75], axis=2)
+    return q50, q75 - q25
+
+
+def bootstrap_neighbor_statistics(data_std,
+    cost_column="avg_cost_per_marker",
+    county_column="County",
+    metrics=["wetlandd", "pop_d", "roadoverarea"],
+    n_neighbors=10,
+    n_resamples=10000,
+    confidence=0.95,
+    include_target=False,
+    memory_limit_mb=256,
+    n_jobs=-1,
+    random_state=42,
+    backend="exact",
+    backend_params=None):
+    """
+    Computes the median and IQR of every county's neighbor-group cost per corner with bootstrap
+    percentile confidence intervals.
+
+    Resampling is vectorized over all counties with a (counties x resamples x k) index array, split
+    into chunks that fit `memory_limit_mb` (at least one per process) and distributed over `n_jobs` processes.
+
+    Parameters:
+    - data_std (pd.DataFrame): Standardized data with the metrics, county names and cost column.
+    - cost_column (str): Column representing the cost per marker.
+    - county_column (str): Column representing the county names.
+    - metrics (list): Metric columns used to find neighbors.
+    - n_neighbors (int): Size of each neighbor group.
+    - n_resamples (int): Number of bootstrap resamples per county.
+    - confidence (float): Confidence level of the intervals.
+    - include_target (bool): If True, the target county's own cost is part of its group.
+    - memory_limit_mb (int): Approximate memory bound for a single chunk of resamples.
+    - n_jobs (int): Number of worker processes (-1 uses all cores, 1 runs in-process).
+    - random_state (int): Seed for the resampling; results are reproducible for a fixed seed, memory_limit_mb and n_jobs.
+    - backend (str): Neighbor search backend ("exact" or "ivf").
+    - backend_params (dict): Parameters for the selected backend.
+
+    Returns:
+    - pd.DataFrame: One row per county with the median, IQR and their confidence bounds.
+    """
+    costs = data_std[cost_column].values.astype(float)
+    _, indices = query_all_neighbors(data_std[metrics].values, n_neighbors, backend=backend, backend_params=backend_params)
+    if (indices < 0).any():
+        raise ValueError("Neighbor search returned incomplete groups; increase n_probe or use the exact backend.")
+
+    neighbor_costs = costs[indices]
+    if include_target:
+        neighbor_costs = np.column_stack([costs, neighbor_costs])
+    n_groups, group_size = neighbor_costs.shape
+
+    # Split the resamples into memory-bounded chunks, each with an independent seed
+    chunk_size = _resamples_per_chunk(n_groups, group_size, memory_limit_mb)
+    seeds, chunk_sizes = _split_chunks(n_resamples, chunk_size, random_state, resolve_n_jobs(n_jobs))
+    n_jobs = resolve_n_jobs(n_jobs, len(chunk_sizes))
+    print(f"Bootstrapping {n_resamples} resamples for {n_groups} counties in {len(chunk_sizes)} chunks on {n_jobs} process(es)...")
+    results = _run_chunks(_bootstrap_chunk, neighbor_costs, seeds, chunk_sizes, n_jobs)
+
+    boot_medians = np.concatenate([medians for medians, _ in results], axis=1)
+    boot_iqrs = np.concatenate([iqrs for _, iqrs in results], axis=1)
+
+    alpha = (1 - confidence) / 2 * 100
+    q25, q50, q75 = np.percentile(neighbor_costs, [25, 50, 75], axis=1)
+    median_low, median_high = np.percentile(boot_medians, [alpha, 100 - alpha], axis=1)
+    iqr_low, iqr_high = np.percentile(boot_iqrs, [alpha, 100 - alpha], axis=1)
+
+    summary = pd.DataFrame({
+        county_column: data_std[county_column].values,
+        "group_size": group_size,
+        "median": q50,
+        "median_ci_low": median_low,
+        "median_ci_high": median_high,
+        "iqr": q75 - q25,
+        "iqr_ci_low": iqr_low,
+        "iqr_ci_high": iqr_high,
+    })
+    print(f"Bootstrap {confidence:.0%} confidence intervals computed for {n_groups} neighbor groups.")
+    return summary
+
+
+def _dispersion(values, method):
+    """Dispersion of cost groups along the last axis."""
+    if method == "std":
+        return values.std(axis=-1, ddof=1)
+    if method == "iqr":
+        q25, q75 = np.percentile(values, [25, 75], axis=-1)
+        return q75 - q25
+    if method == "mad":
+        return np.median(np.abs(values - np.median(values, axis=-1, keepdims=True)), axis=-1)
+    raise ValueError(f"Unknown dispersion method '{method}'. Options: ['std', 'iqr', 'mad']")
+
+
+def _permutation_chunk(seed, n_permutations, costs=None, group_size=10, dispersion="std"):
+    """
+    Draws n_permutations random same-size groups for every county at once (never containing the county
+    itself) and returns their dispersions with shape (counties x permutations).
+    """
+    costs = worker_array("costs", costs)
+    n_counties = costs.shape[0]
+    rng = np.random.default_rng(seed)
+
+    # The k smallest of n uniform keys select a uniformly random k-subset without replacement
+    keys = rng.random((n_counties, n_permutations, n_counties))
+    keys[np.arange(n_counties), :, np.arange(n_counties)] = np.inf
+    groups = np.argpartition(keys, group_size - 1, axis=2)[:, :, :group_size]
+    return _dispersion(costs[groups], dispersion)
+
+
+def neighbor_permutation_test(data_std,
+    cost_column="avg_cost_per_marker",
+    county_column="County",
+    metrics=["wetlandd", "pop_d", "roadoverarea"],
+    n_neighbors=10,
+    n_permutations=10000,
+    dispersion="std",
+    memory_limit_mb=256,
+    n_jobs=-1,
+    random_state=42,
+    backend="exact",
+    backend_params=None):
+    """
+    Tests whether feature-space neighbors are more alike in cost than random county groups of the same size.
+
+    For every county the cost dispersion of its neighbor group is compared against the dispersion of
+    `n_permutations` random groups drawn from the other counties. The overall test compares the mean
+    dispersion across all counties against the mean over the random groups of each permutation.
+    Permutations are vectorized over counties, chunked to `memory_limit_mb` and spread over `n_jobs` processes.
+
+    Parameters:
+    - data_std (pd.DataFrame): Standardized data with the metrics, county names and cost column.
+    - cost_column (str): Column representing the cost per marker.
+    - county_column (str): Column representing the county names.
+    - metrics (list): Metric columns used to find neighbors.
+    - n_neighbors (int): Size of each neighbor group.
+    - n_permutations (int): Number of random groups per county.
+    - dispersion (str): Dispersion statistic ("std", "iqr" or "mad").
+    - memory_limit_mb (int): Approximate memory bound for a single chunk of permutations.
+    - n_jobs (int): Number of worker processes (-1 uses all cores, 1 runs in-process).
+    - random_state (int): Seed for the permutations.
+    - backend (str): Neighbor search backend ("exact" or "ivf").
+    - backend_params (dict): Parameters for the selected backend.
+
+    Returns:
+    - tuple: (per_county, overall) where per_county has the observed and null-mean dispersion and the
+      one-sided p-value for each county, and overall is a dict with the same fields for the mean dispersion.
+    """
+    costs = data_std[cost_column].values.astype(float)
+    n_counties = costs.shape[0]
+    _, indices = query_all_neighbors(data_std[metrics].values, n_neighbors, backend=backend, backend_params=backend_params)
+    if (indices < 0).any():
+        raise ValueError("Neighbor search returned incomplete groups; increase n_probe or use the exact backend.")
+    group_size = indices.shape[1]
+    observed = _dispersion(costs[indices], dispersion)
+
+    # Random keys (float64) dominate memory: counties x permutations x counties per chunk
+    chunk_size = max(1, int(memory_limit_mb * 1024 ** 2 // (n_counties * n_counties * 8 * 2)))
+    seeds, chunk_sizes = _split_chunks(n_permutations, chunk_size, random_state, resolve_n_jobs(n_jobs))
+    n_jobs = resolve_n_jobs(n_jobs, len(chunk_sizes))
+    print(f"Running {n_permutations} permutations for {n_counties} counties in {len(chunk_sizes)} chunks on {n_jobs} process(es)...")
+    null = np.concatenate(
+        _run_chunks(_permutation_chunk, costs, seeds, chunk_sizes, n_jobs, group_size=group_size, dispersion=dispersion),
+        axis=1
+    )
+
+    # One-sided: neighbors are "more alike" when their dispersion is small
+    p_values = (1 + (null <= observed[:, None]).sum(axis=1)) / (1 + n_permutations)
+    per_county = pd.DataFrame({
+        county_column: data_std[county_column].values,
+        "observed_dispersion": observed,
+        "null_mean_dispersion": null.mean(axis=1),
+        "p_value": p_values,
+    })
+
+    observed_mean = observed.mean()
+    null_means = null.mean(axis=0)
+    overall = {
+        "observed_dispersion": observed_mean,
+        "null_mean_dispersion": null_means.mean(),
+        "p_value": (1 + (null_means <= observed_mean).sum()) / (1 + n_permutations),
+    }
+    print(f"Overall mean {dispersion} of neighbor costs: {observed_mean:.2f} vs {overall['null_mean_dispersion']:.2f} "
+          f"for random groups (p = {overall['p_value']:.4g}).")
+    return per_county, overall
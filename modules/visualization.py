@@ -1,11 +1,146 @@
 # modules/visualization.py
+import hashlib
+import json
+import os
+import shutil
 import seaborn as sns
 import matplotlib.pyplot as plt
 import pandas as pd
+import plotly
 import plotly.express as px
 import plotly.graph_objects as go
+import plotly.io as pio
 import numpy as np
 
+# When set, interactive figures are written to this directory as HTML instead of being opened
+_output_dir = None
+
+# On-disk cache of rendered figures, keyed by a hash of the plotted data and settings
+_cache_dir = None
+_cache_max_mb = 200
+
+
+def set_output_dir(path):
+    """
+    Writes subsequent interactive figures to `path` as HTML files instead of opening them.
+    Pass None to restore fig.show().
+    """
+    global _output_dir
+    _output_dir = path
+
+
+def set_figure_cache(path, max_mb=200):
+    """
+    Caches interactive figures in `path` (as Plotly JSON, plus the HTML once written), evicting the least
+    recently used entries beyond `max_mb`. Pass None to disable the cache.
+    """
+    global _cache_dir, _cache_max_mb
+    _cache_dir, _cache_max_mb = path, max_mb
+
+
+def _figure_key(name, *parts):
+    """Hash of a figure's name, the plotted data slices and its visual settings."""
+    digest = hashlib.sha256(f"{name}|plotly {plotly.__version__}".encode())
+    for part in parts:
+        if isinstance(part, (pd.DataFrame, pd.Series)):
+            try:
+                digest.update(pd.util.hash_pandas_object(part, index=True).values.tobytes())
+                columns = part.columns if isinstance(part, pd.DataFrame) else [part.name]
+                digest.update(repr(list(columns)).encode())
+            except TypeError:
+                # Columns holding lists (e.g. neighbor cost arrays) are hashed through their JSON form
+                digest.update(part.to_json().encode())
+        elif isinstance(part, np.ndarray):
+            digest.update(part.tobytes())
+        else:
+            digest.update(json.dumps(part, sort_keys=True, default=str).encode())
+    return f"{name}-{digest.hexdigest()[:32]}"
+
+
+def _cache_path(key, extension):
+    return os.path.join(_cache_dir, f"{key}.{extension}")
+
+
+def _write_atomic(path, write):
+    """Writes through a temporary file so concurrent runs never read a partial entry."""
+    temporary = f"{path}.{os.getpid()}.tmp"
+    write(temporary)
+    os.replace(temporary, path)
+
+
+def _evict_figures():
+    """
+    Deletes the least recently used cache entries until the cache fits in its size bound. Entries that
+    another run removes in the meantime are skipped.
+    """
+    entries = []
+    for entry in os.scandir(_cache_dir):
+        if not entry.name.endswith(".tmp"):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= _cache_max_mb * 1024 ** 2:
+            break
+        total -= size
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _show_cached(key, name):
+    """
+    Shows a cached figure if the cache holds `key`. Returns False on a cache miss, including an entry
+    evicted by a concurrent run while it is being read.
+    """
+    if _cache_dir is None or not os.path.exists(_cache_path(key, "json")):
+        return False
+    fig = None
+    try:
+        os.utime(_cache_path(key, "json"))
+        if _output_dir is not None and os.path.exists(_cache_path(key, "html")):
+            os.utime(_cache_path(key, "html"))
+            os.makedirs(_output_dir, exist_ok=True)
+            shutil.copyfile(_cache_path(key, "html"), os.path.join(_output_dir, f"{name}.html"))
+        else:
+            fig = pio.read_json(_cache_path(key, "json"))
+    except FileNotFoundError:
+        return False
+    if fig is not None:
+        _show(fig, name, key)
+    print(f"Figure '{name}' served from the figure cache.")
+    return True
+
+
+def _show(fig, name, key=None):
+    """
+    Shows the figure, or saves it as <name>.html when an output directory is set. With a cache key,
+    the figure (and its HTML) is also stored in the figure cache.
+    """
+    caching = key is not None and _cache_dir is not None
+    if caching:
+        os.makedirs(_cache_dir, exist_ok=True)
+        if not os.path.exists(_cache_path(key, "json")):
+            _write_atomic(_cache_path(key, "json"), lambda path: pio.write_json(fig, path))
+
+    if _output_dir is None:
+        fig.show()
+    else:
+        os.makedirs(_output_dir, exist_ok=True)
+        html_path = os.path.join(_output_dir, f"{name}.html")
+        # plotly.js is loaded from its CDN rather than embedded (~4.8 MB) in every file and cache entry
+        fig.write_html(html_path, include_plotlyjs="cdn")
+        if caching:
+            _write_atomic(_cache_path(key, "html"), lambda path: shutil.copyfile(html_path, path))
+
+    if caching:
+        _evict_figures()
+
 def visualize_clusters(data, cluster_labels, diag_kind="kde", alpha=0.6, marker_size=50, title="Cluster Visualization", palette="bright"):
     """
     Creates a pair plot of the data with clusters distinguished by color.
@@ -50,6 +185,10 @@ def visualize_clusters_interactive(data, cluster_labels, name_field="County", hi
     Returns:
     - None: Displays the interactive plot.
     """
+    key = _figure_key("clusters_interactive", data, np.asarray(cluster_labels), name_field, highlight_county, color_scale)
+    if _show_cached(key, "clusters_interactive"):
+        return
+
     # Ensure the data includes the necessary columns
     data = data.copy()
     data["Cluster"] = cluster_labels
@@ -97,7 +236,7 @@ def visualize_clusters_interactive(data, cluster_labels, name_field="County", hi
     #                         yref=f"y{y_dim}",
     #                     )
 
-    fig.show()
+    _show(fig, "clusters_interactive", key)
 
 def visualize_cost_distribution(data, cluster_labels, cost_column="avg_cost_per_marker", name_column="County"):
     """
@@ -112,6 +251,10 @@ def visualize_cost_distribution(data, cluster_labels, cost_column="avg_cost_per_
     Returns:
     - None: Displays the interactive plot.
     """
+    key = _figure_key("cluster_cost_distribution", data[[name_column, cost_column]], np.asarray(cluster_labels), cost_column)
+    if _show_cached(key, "cluster_cost_distribution"):
+        return
+
     # Copy data and add cluster labels for plotting
     plot_data = data.copy()
     plot_data["Cluster"] = cluster_labels
@@ -127,7 +270,7 @@ def visualize_cost_distribution(data, cluster_labels, cost_column="avg_cost_per_
         labels={"Cluster": "Cluster", cost_column: "Avg Cost per Marker"}
     )
     fig.update_traces(marker=dict(size=6, opacity=0.7))
-    fig.show()
+    _show(fig, "cluster_cost_distribution", key)
 
 
 def visualize_neighbor_cost_distribution(data, cost_column="avg_cost_per_marker", county_column="County"):
@@ -141,6 +284,10 @@ def visualize_neighbor_cost_distribution(data, cost_column="avg_cost_per_marker"
     Returns:
     - None: Displays the plot.
     """
+    key = _figure_key("neighbor_cost_distribution", data[[county_column, f"{cost_column}_neighbors"]], cost_column)
+    if _show_cached(key, "neighbor_cost_distribution"):
+        return
+
     # Expand neighbor costs into individual rows for easy plotting
     neighbor_data = pd.DataFrame({
         "Point": data.index.repeat(len(data[f"{cost_column}_neighbors"].iloc[0])),
@@ -157,7 +304,7 @@ def visualize_neighbor_cost_distribution(data, cost_column="avg_cost_per_marker"
         title=f"Distribution of {cost_column.replace('_', ' ').title()} for Nearest Neighbors",
         labels={"Point": "Data Point", f"{cost_column}_neighbors": f"{cost_column.replace('_', ' ').title()}"}
     )
-    fig.show()
+    _show(fig, "neighbor_cost_distribution", key)
 
 
 
@@ -177,6 +324,9 @@ def visualize_target_neighbor_distribution(
     config = config or {}  # Default to empty dict if None
     show_labels = config.get("visualization", {}).get("show_labels", "on_hover")
     selected_groups = config.get("visualization", {}).get("selected_groups", ["Target", "Neighbors", "Target + Neighbors"])
+    key = _figure_key("target_neighbor_distribution", neighbors_data[[county_column, cost_column]], target_county, show_labels, selected_groups)
+    if _show_cached(key, "target_neighbor_distribution"):
+        return
 
     # Add a column to distinguish between groups for plotting
     neighbors_data["Group"] = neighbors_data[county_column].apply(
@@ -265,9 +415,65 @@ def visualize_target_neighbor_distribution(
     )
 
 
-    fig.show()
+    _show(fig, "target_neighbor_distribution", key)
+
+
 
 
+def _visualize_3d_many_neighbors(data, neighbors_data, metrics, county_column="County"):
+    """3D scatter of several targets, each with its neighbors in the target's color; other counties in gray."""
+    key = _figure_key("3d_many_neighbors", data[[county_column] + list(metrics)],
+                      neighbors_data[[county_column, "Target"]])
+    if _show_cached(key, "3d_neighbors"):
+        return
+
+    positions = data.drop_duplicates(county_column).set_index(county_column)[list(metrics)]
+    targets = list(pd.unique(neighbors_data["Target"]))
+    palette = px.colors.qualitative.Dark24
+    fig = go.Figure()
+    for i, target in enumerate(targets):
+        color = palette[i % len(palette)]
+        counties = neighbors_data.loc[neighbors_data["Target"] == target, county_column]
+        target_points = positions.loc[[target]]
+        neighbor_points = positions.loc[counties[counties != target]]
+        fig.add_trace(go.Scatter3d(
+            x=target_points[metrics[0]], y=target_points[metrics[1]], z=target_points[metrics[2]],
+            mode='markers',
+            marker=dict(size=10, color=color, symbol="diamond"),
+            name=target, legendgroup=target,
+            text=target_points.index
+        ))
+        fig.add_trace(go.Scatter3d(
+            x=neighbor_points[metrics[0]], y=neighbor_points[metrics[1]], z=neighbor_points[metrics[2]],
+            mode='markers',
+            marker=dict(size=7, color=color, symbol="circle"),
+            name=f"Neighbors of {target}", legendgroup=target, showlegend=False,
+            text=neighbor_points.index
+        ))
+
+    other_data = data[~data[county_column].isin(neighbors_data[county_column])]
+    fig.add_trace(go.Scatter3d(
+        x=other_data[metrics[0]], y=other_data[metrics[1]], z=other_data[metrics[2]],
+        mode='markers',
+        marker=dict(size=5, color='gray', symbol="cross"),
+        name="Other Counties",
+        text=other_data[county_column]
+    ))
+
+    fig.update_layout(
+        title={
+            "text": f"3D Plot of Metrics Showing Nearest Neighbors of {len(targets)} Target Counties",
+            "x": 0.5,
+            "xanchor": "center",
+            "font": {"size": 24, "family": "Arial, sans-serif"}
+        },
+        scene=dict(
+            xaxis_title=metrics[0],
+            yaxis_title=metrics[1],
+            zaxis_title=metrics[2]
+        )
+    )
+    _show(fig, "3d_neighbors", key)
 
 
 def visualize_3d_neighbors(data, target_county="Van Buren", neighbors=[], metrics=["Metric1", "Metric2", "Metric3"], county_column="County"):
@@ -277,7 +483,9 @@ def visualize_3d_neighbors(data, target_county="Van Buren", neighbors=[], metric
     Parameters:
     - data (pd.DataFrame): Data containing the metrics and county names.
     - target_county (str): The name of the target county to highlight.
-    - neighbors (list): List of nearest neighbor counties to highlight.
+    - neighbors (list or pd.DataFrame): List of nearest neighbor counties to highlight, or the multi-target
+      result of find_target_neighbors (with a "Target" column), in which case every target and its neighbors
+      are drawn in one figure and target_county is ignored.
     - metrics (list): List of three metric column names to plot in 3D space.
     - county_column (str): Column name representing the county names.
 
@@ -287,6 +495,12 @@ def visualize_3d_neighbors(data, target_county="Van Buren", neighbors=[], metric
     if len(metrics) != 3:
         print("Error: Please provide exactly three metrics for the 3D plot.")
         return
+    if isinstance(neighbors, pd.DataFrame):
+        _visualize_3d_many_neighbors(data, neighbors, metrics, county_column)
+        return
+    key = _figure_key("3d_neighbors", data[[county_column] + list(metrics)], target_county, sorted(neighbors))
+    if _show_cached(key, "3d_neighbors"):
+        return
 
     # Filter data into different categories for coloring and symbolization
     target_data = data[data[county_column] == target_county]
@@ -347,7 +561,7 @@ def visualize_3d_neighbors(data, target_county="Van Buren", neighbors=[], metric
         )
     )
 
-    fig.show()
+    _show(fig, "3d_neighbors", key)
 
 
 
@@ -369,6 +583,10 @@ def visualize_3d_with_costs(data, metrics=["Metric1", "Metric2", "Metric3"], cou
     if len(metrics) != 3:
         print("Error: Please provide exactly three metrics for the 3D plot.")
         return
+    # Independent of the target county, so repeated knn runs reuse the cached figure
+    key = _figure_key("3d_with_costs", data[[county_column, cost_column] + list(metrics)], use_log_scale)
+    if _show_cached(key, "3d_with_costs"):
+        return
 
     # Apply log scale to the cost column if specified
     color_values = np.log10(data[cost_column]) if use_log_scale else data[cost_column]
@@ -410,4 +628,4 @@ def visualize_3d_with_costs(data, metrics=["Metric1", "Metric2", "Metric3"], cou
         )
     )
 
-    fig.show()
+    _show(fig, "3d_with_costs", key)
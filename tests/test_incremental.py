@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+from modules.incremental import build_neighbor_state, update_neighbor_state, neighbor_table
+
+METRICS = ["wetlandd", "pop_d", "roadoverarea"]
+
+
+def _counties(names, rng):
+    return pd.DataFrame({
+        "County": names,
+        **{metric: rng.uniform(0.1, 0.9, len(names)) for metric in METRICS},
+        "avg_cost_per_marker": rng.uniform(300.0, 1500.0, len(names)),
+    })
+
+
+def test_update_matches_rebuild():
+    rng = np.random.default_rng(0)
+    data = _counties([f"County {i}" for i in range(60)], rng)
+    # The first two counties hold every metric's minimum and maximum, so min-max scaling is unchanged
+    data.loc[0, METRICS] = 0.0
+    data.loc[1, METRICS] = 1.0
+    state = build_neighbor_state(data, METRICS, n_neighbors=5, method="minmax")
+
+    updated = data.drop(index=[10, 11]).reset_index(drop=True)
+    updated.loc[updated["County"] == "County 20", METRICS] = [0.5, 0.5, 0.5]
+    updated.loc[updated["County"] == "County 30", "avg_cost_per_marker"] = 999.0
+    updated = pd.concat([updated, _counties(["New 1", "New 2"], rng)], ignore_index=True)
+
+    state, report = update_neighbor_state(state, updated)
+    rebuilt = build_neighbor_state(updated, METRICS, n_neighbors=5, method="minmax")
+
+    assert not report["full_rebuild"]
+    assert report["recomputed"] < len(updated)
+    pd.testing.assert_frame_equal(neighbor_table(state), neighbor_table(rebuilt))
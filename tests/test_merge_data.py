@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+from modules.aggregate import aggregate_corners
+from modules.load_data import load_csv
+from modules.merge_data import merge_county_data
+
+
+def _write(path, frame):
+    frame.to_csv(path, index=False)
+    return str(path)
+
+
+def test_survey_county_without_corner_records(tmp_path):
+    counties = ["Alger", "Barry", "Clare"]
+    survey = _write(tmp_path / "survey.csv", pd.DataFrame({
+        "County With Asterisks": counties,
+        "County Without Asterisks and Trimmed": counties,
+        "Total Remon Corners in County": [10, 20, 30],
+        "Average Spent per Corner Completed": [500.0, 600.0, 700.0],
+    }))
+    population = _write(tmp_path / "population.csv", pd.DataFrame({"NAME *": counties, "pop_d": [1.0, 2.0, 3.0]}))
+    road = _write(tmp_path / "road.csv", pd.DataFrame({"NAME": counties, "roadoverarea": [1.0, 2.0, 3.0]}))
+    wetlands = _write(tmp_path / "wetlands.csv", pd.DataFrame({"NAME": counties, "wetlandd": [1.0, 2.0, 3.0]}))
+    # Clare has no corner records
+    corners = _write(tmp_path / "corners.csv", pd.DataFrame({
+        "County": ["Alger", "Alger", "Barry"],
+        "Cost": [400.0, np.nan, 800.0],
+        "Completed": ["yes", "no", "yes"],
+    }))
+
+    merged = merge_county_data(survey, population, road, wetlands, corner_stats=aggregate_corners(corners))
+    merged_path = tmp_path / "merged.csv"
+    merged.to_csv(merged_path, index=False)
+    reloaded = load_csv(str(merged_path), schema="merged").set_index("County")
+
+    assert reloaded.loc["Clare", "Total Remon Corners in County"] == 0
+    assert reloaded.loc["Clare", "Remon Corners Completed"] == 0
+    assert np.isnan(reloaded.loc["Clare", "Average Spent per Corner Completed"])
+    assert reloaded.loc["Alger", "Total Remon Corners in County"] == 2
+    assert reloaded.loc["Alger", "Remon Corners Completed"] == 1